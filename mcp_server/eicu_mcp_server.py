@@ -3,23 +3,98 @@ MCP Server for eICU Medical Data
 Loads all patient files and serves complete patient data (including actual outcomes)
 """
 import os
+import re
 import sys
+import json
+import hashlib
+import argparse
+import numpy as np
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from intelli.mcp import PandasMCPServerBuilder, PANDAS_AVAILABLE
+from partition_eicu_data import PARTITION_DIR, PartitionedDataset
 
+DATA_DIR = Path("eicu_demo_data")
+CACHE_DIR = Path("cache")
 
-def load_complete_patient_data():
-    """Load and merge all patient data files including actual outcomes"""
-    data_dir = Path("eicu_demo_data")
+SOURCE_FILES = {
+    "patient": "patient.csv",
+    "apache_result": "apachePatientResult.csv",
+    "apache_vars": "apacheApsVar.csv",
+    "labs": "lab.csv",
+    "vitals": "vitalPeriodic.csv",
+}
+
+# Critical lab flags: flag name (served as has_<name>) -> lowercase substring
+# matched against labname. Add entries here to flag more labs.
+CRITICAL_LABS = {
+    "wbc": "wbc",
+    "creatinine": "creatinine",
+    "lactate": "lactate",
+    "bilirubin": "bilirubin",
+    "glucose": "glucose",
+}
+
+# Labs summarised per patient as lab_<name>_first/_last/_min/_max/_abnormal_count.
+# Keys are labname values in lab.csv (the whitelist); values are the adult
+# reference range (low, high), either side None when one-sided.
+LAB_REFERENCE_RANGES = {
+    "sodium": (135, 145),
+    "potassium": (3.5, 5.1),
+    "chloride": (98, 107),
+    "bicarbonate": (22, 29),
+    "BUN": (7, 20),
+    "creatinine": (0.6, 1.3),
+    "glucose": (70, 140),
+    "bedside glucose": (70, 140),
+    "calcium": (8.5, 10.5),
+    "magnesium": (1.7, 2.2),
+    "phosphate": (2.5, 4.5),
+    "albumin": (3.5, 5.0),
+    "total bilirubin": (0.1, 1.2),
+    "lactate": (0.5, 2.0),
+    "Hgb": (12, 17.5),
+    "Hct": (36, 50),
+    "WBC x 1000": (4, 11),
+    "platelets x 1000": (150, 400),
+    "PT - INR": (0.8, 1.2),
+    "pH": (7.35, 7.45),
+    "paCO2": (35, 45),
+    "paO2": (80, 100),
+    "troponin - I": (None, 0.04),
+}
+
+LAB_STATS = ["first", "last", "min", "max", "abnormal_count"]
+
+# Vital signs summarised per patient as <name>_mean / <name>_max
+VITAL_COLUMNS = ["heartrate", "systemicsystolic", "temperature"]
+
+# Bump when the cached table layout changes so old caches are rebuilt
+CACHE_FORMAT = 3
 
-    files = {
-        "patient": "patient.csv",
-        "apache_result": "apachePatientResult.csv",
-        "apache_vars": "apacheApsVar.csv",
-        "labs": "lab.csv",
-        "vitals": "vitalPeriodic.csv",
-    }
+
+def load_complete_patient_data(
+    critical_labs: dict = None,
+    compact: bool = True,
+    lab_ranges: dict = None,
+    parallel: bool = True,
+    use_partitions: bool = True,
+):
+    """Load and merge all patient data files including actual outcomes
+
+    With ``parallel=True`` the core, lab and vitals tables are read and
+    pre-aggregated on a thread pool, so cold-start time follows the slowest
+    file rather than the sum. ``compact`` applies the dtype plan from
+    ``compact_dtypes``. ``lab_ranges`` overrides ``LAB_REFERENCE_RANGES`` (an
+    empty dict skips the per-lab summaries). With ``use_partitions`` the lab
+    and vitals tables are read from the Parquet layout written by
+    partition_eicu_data.py when it is up to date with the CSVs.
+    """
+    critical_labs = critical_labs or CRITICAL_LABS
+    lab_ranges = LAB_REFERENCE_RANGES if lab_ranges is None else lab_ranges
+    data_dir = DATA_DIR
+    files = SOURCE_FILES
 
     # Check files exist
     missing = []
@@ -31,74 +106,50 @@ def load_complete_patient_data():
         print(f"Missing files: {missing}")
         return None
 
-    # Load core data
-    patient_df = pd.read_csv(data_dir / files["patient"])
-    apache_df = pd.read_csv(data_dir / files["apache_result"])
-    apache_vars_df = pd.read_csv(data_dir / files["apache_vars"])
+    # Read and pre-aggregate the independent sources concurrently (pandas'
+    # C parser and groupby kernels release the GIL for most of their work),
+    # then do the cheap per-patient merges here in a fixed order.
+    partitions = PartitionedDataset.load(PARTITION_DIR) if use_partitions else None
+    with ThreadPoolExecutor(max_workers=3 if parallel else 1) as pool:
+        core = pool.submit(read_core_tables, data_dir, files)
+        labs = pool.submit(
+            lab_tables, source_path(data_dir, files, "labs", partitions), critical_labs, lab_ranges
+        )
+        vitals = pool.submit(vitals_table, source_path(data_dir, files, "vitals", partitions))
+        merged_df = core.result()
 
-    # Remove duplicates from Apache data to prevent duplicate rows after merge
-    apache_df = apache_df.drop_duplicates(subset=["patientunitstayid"])
-    apache_vars_df = apache_vars_df.drop_duplicates(subset=["patientunitstayid"])
-
-    # Merge core data
-    merged_df = patient_df.merge(apache_df, on="patientunitstayid", how="left")
-    merged_df = merged_df.merge(apache_vars_df, on="patientunitstayid", how="left")
-
-    # Add lab counts per patient
-    try:
-        labs_df = pd.read_csv(data_dir / files["labs"])
-        if not labs_df.empty:
-            # Get lab counts and critical lab flags
-            lab_counts = (
-                labs_df.groupby("patientunitstayid")
-                .size()
-                .reset_index(name="lab_count")
-            )
+        # Add lab counts per patient
+        try:
+            lab_counts, lab_flags, lab_summary = labs.result()
             merged_df = merged_df.merge(lab_counts, on="patientunitstayid", how="left")
-
-            # Add critical lab flags
-            critical_labs = ["wbc", "creatinine", "lactate", "bilirubin", "glucose"]
-            for lab in critical_labs:
-                lab_patients = labs_df[
-                    labs_df["labname"].str.lower().str.contains(lab, na=False)
-                ]["patientunitstayid"].unique()
-                merged_df[f"has_{lab}"] = merged_df["patientunitstayid"].isin(
-                    lab_patients
-                )
-    except:
-        merged_df["lab_count"] = 0
-
-    # Add vitals stats per patient
-    try:
-        vitals_df = pd.read_csv(data_dir / files["vitals"])
-        if not vitals_df.empty:
-            vitals_stats = (
-                vitals_df.groupby("patientunitstayid")
-                .agg(
-                    {
-                        "heartrate": ["mean", "max"],
-                        "systemicsystolic": ["mean", "max"],
-                        "temperature": ["mean", "max"],
-                    }
-                )
-                .round(2)
+            merged_df = merged_df.join(lab_flags, on="patientunitstayid")
+            merged_df[lab_flags.columns] = (
+                merged_df[lab_flags.columns].fillna(False).astype(bool)
             )
+            if lab_summary is not None:
+                merged_df = merged_df.join(lab_summary, on="patientunitstayid")
+                counts = [lab_feature_name(name, "abnormal_count") for name in lab_ranges]
+                merged_df[counts] = merged_df[counts].astype("Int64")
+        except:
+            merged_df["lab_count"] = 0
 
-            vitals_stats.columns = [
-                "_".join(col).strip() for col in vitals_stats.columns
-            ]
-            vitals_stats = vitals_stats.reset_index()
+        # Add vitals stats per patient
+        try:
+            vitals_stats = vitals.result()
             merged_df = merged_df.merge(
                 vitals_stats, on="patientunitstayid", how="left"
             )
-    except:
-        pass
+        except:
+            pass
 
     # Add convenient mortality flag (keep actual outcomes for comparison)
     merged_df["expired"] = merged_df["actualicumortality"].str.contains(
         "EXPIRED", case=False, na=False
     )
 
+    if compact:
+        merged_df = compact_dtypes(merged_df)
+
     print(
         f"Loaded complete dataset: {len(merged_df)} patients with {len(merged_df.columns)} features"
     )
@@ -109,28 +160,318 @@ def load_complete_patient_data():
     return merged_df
 
 
+def source_path(data_dir: Path, files: dict, name: str, partitions: PartitionedDataset = None) -> Path:
+    """Partition directory for a source table if it is fresh, else its CSV"""
+    if partitions is not None and partitions.is_fresh(name, data_dir):
+        print(f"Reading {name} from {partitions.table_dir(name)}")
+        return partitions.table_dir(name)
+    return data_dir / files[name]
+
+
+def read_source(path: Path) -> pd.DataFrame:
+    """Read a source table from a partition directory (Parquet) or a CSV"""
+    if path.is_dir():
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+
+def read_core_tables(data_dir: Path, files: dict) -> pd.DataFrame:
+    """Patient table merged with the de-duplicated APACHE result and variable tables"""
+    patient_df = pd.read_csv(data_dir / files["patient"])
+    apache_df = pd.read_csv(data_dir / files["apache_result"])
+    apache_vars_df = pd.read_csv(data_dir / files["apache_vars"])
+
+    # Remove duplicates from Apache data to prevent duplicate rows after merge
+    apache_df = apache_df.drop_duplicates(subset=["patientunitstayid"])
+    apache_vars_df = apache_vars_df.drop_duplicates(subset=["patientunitstayid"])
+
+    # Merge core data
+    merged_df = patient_df.merge(apache_df, on="patientunitstayid", how="left")
+    return merged_df.merge(apache_vars_df, on="patientunitstayid", how="left")
+
+
+def lab_tables(path: Path, critical_labs: dict, lab_ranges: dict):
+    """Per-patient lab counts, critical lab flags and (optionally) per-lab summaries"""
+    labs_df = read_source(path)
+    if labs_df.empty:
+        raise ValueError(f"{path} has no rows")
+
+    lab_counts = (
+        labs_df.groupby("patientunitstayid")
+        .size()
+        .reset_index(name="lab_count")
+    )
+
+    # Critical lab flags: classify each distinct lab name once, then
+    # broadcast the hits to every lab row via its category code and
+    # reduce to one flag per lab in a single groupby.
+    names = pd.Categorical(labs_df["labname"].str.lower())
+    hits = np.array(
+        [
+            [pattern in name for pattern in critical_labs.values()]
+            for name in names.categories
+        ],
+        dtype=bool,
+    ).reshape(len(names.categories), len(critical_labs))
+    row_hits = np.zeros((len(labs_df), len(critical_labs)), dtype=bool)
+    known = names.codes >= 0
+    row_hits[known] = hits[names.codes[known]]
+    lab_flags = (
+        pd.DataFrame(
+            row_hits,
+            columns=[f"has_{lab}" for lab in critical_labs],
+            index=labs_df["patientunitstayid"].to_numpy(),
+        )
+        .groupby(level=0)
+        .any()
+    )
+
+    lab_summary = lab_pivot(labs_df, lab_ranges) if lab_ranges else None
+    return lab_counts, lab_flags, lab_summary
+
+
+def vitals_table(path: Path) -> pd.DataFrame:
+    """Per-patient <vital>_mean / <vital>_max"""
+    vitals_df = read_source(path)
+    if vitals_df.empty:
+        raise ValueError(f"{path} has no rows")
+    # The Parquet copy keeps the CSV column types polars inferred (temperature is text)
+    vitals_df[VITAL_COLUMNS] = vitals_df[VITAL_COLUMNS].apply(pd.to_numeric, errors="coerce")
+    vitals_stats = (
+        vitals_df.groupby("patientunitstayid")
+        .agg(
+            {col: ["mean", "max"] for col in VITAL_COLUMNS}
+        )
+        .round(2)
+    )
+
+    vitals_stats.columns = [
+        "_".join(col).strip() for col in vitals_stats.columns
+    ]
+    return vitals_stats.reset_index()
+
+
+def lab_feature_name(labname: str, stat: str) -> str:
+    """Served column name for one lab statistic, e.g. ("WBC x 1000", "max") -> lab_wbc_x_1000_max"""
+    slug = re.sub(r"[^0-9a-z]+", "_", labname.lower()).strip("_")
+    return f"lab_{slug}_{stat}"
+
+
+def lab_pivot(labs_df: pd.DataFrame, lab_ranges: dict) -> pd.DataFrame:
+    """Wide per-patient lab summaries: one groupby over (patient, lab) and one unstack
+
+    Only labs named in ``lab_ranges`` are kept. first/last follow
+    labresultoffset; abnormal_count counts results outside the reference range.
+    """
+    labs = labs_df[labs_df["labname"].isin(lab_ranges)].sort_values(
+        ["patientunitstayid", "labresultoffset"], kind="stable"
+    )
+    value = pd.to_numeric(labs["labresult"], errors="coerce")
+    low = labs["labname"].map({name: bounds[0] for name, bounds in lab_ranges.items()})
+    high = labs["labname"].map({name: bounds[1] for name, bounds in lab_ranges.items()})
+    labs = labs.assign(
+        labresult=value,
+        abnormal=(value < low.astype(float)) | (value > high.astype(float)),
+    )
+    summaries = labs.groupby(["patientunitstayid", "labname"]).agg(
+        first=("labresult", "first"),
+        last=("labresult", "last"),
+        min=("labresult", "min"),
+        max=("labresult", "max"),
+        abnormal_count=("abnormal", "sum"),
+    )
+    wide = summaries.unstack("labname")
+    wide = wide.reindex(columns=pd.MultiIndex.from_product([LAB_STATS, list(lab_ranges)]))
+    wide.columns = [lab_feature_name(name, stat) for stat, name in wide.columns]
+    return wide
+
+
+def compact_dtypes(df: pd.DataFrame, max_categories: int = 256, category_ratio: float = 0.5) -> pd.DataFrame:
+    """Downcast the merged table and report the memory before and after
+
+    - integer columns (ids, counts): smallest signed type holding the range
+    - strings with few distinct values: category
+    - float vitals aggregates (<vital>_mean / <vital>_max): float32
+    - float lab summaries (lab_<name>_first/_last/_min/_max): float32
+    Columns with missing values keep their float dtype; booleans are already one byte.
+    """
+    vital_aggregates = {f"{col}_{stat}" for col in VITAL_COLUMNS for stat in ("mean", "max")}
+    before = df.memory_usage(deep=True).sum()
+    changes = {}
+    for name in df.columns:
+        series = df[name]
+        if pd.api.types.is_integer_dtype(series):
+            compacted = pd.to_numeric(series, downcast="integer")
+        elif pd.api.types.is_object_dtype(series):
+            n_unique = series.nunique()
+            if n_unique > min(max_categories, max(1, category_ratio * len(df))):
+                continue
+            compacted = series.astype("category")
+        elif pd.api.types.is_float_dtype(series) and (name in vital_aggregates or name.startswith("lab_")):
+            compacted = series.astype("float32")
+        else:
+            continue
+        if compacted.dtype != series.dtype:
+            changes[name] = (series.dtype, compacted.dtype)
+            df[name] = compacted
+    after = df.memory_usage(deep=True).sum()
+    if changes:
+        print(
+            f"Dtype plan: {before / 1024:.1f} KiB -> {after / 1024:.1f} KiB "
+            f"({1 - after / before:.0%} smaller)"
+        )
+        # One line per dtype change; the wide lab table would otherwise print hundreds
+        groups = {}
+        for name, (old, new) in changes.items():
+            groups.setdefault(f"{old} -> {new}", []).append(name)
+        for change, names in groups.items():
+            shown = ", ".join(names[:4]) + (f", ... ({len(names)} columns)" if len(names) > 4 else "")
+            print(f"  {change}: {shown}")
+    return df
+
+
+def source_fingerprint(data_dir: Path = DATA_DIR, hash_contents: bool = False, **config) -> str:
+    """Fingerprint every file in the data directory plus the loader config"""
+    digest = hashlib.sha256()
+    digest.update(json.dumps(config, sort_keys=True, default=str).encode())
+    for path in sorted(p for p in data_dir.iterdir() if p.is_file()):
+        stat = path.stat()
+        digest.update(f"{path.name}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+        if hash_contents:
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def load_cached_patient_data(
+    cache_dir: Path = CACHE_DIR, hash_contents: bool = False, refresh: bool = False, **kwargs
+):
+    """Return the path of a Feather (Arrow IPC) cache of the merged table, building it if stale
+
+    The key covers the source files, CACHE_FORMAT and the effective lab
+    tables and vitals columns, so editing CRITICAL_LABS or
+    LAB_REFERENCE_RANGES rebuilds the cache.
+    """
+    if not DATA_DIR.is_dir():
+        print(f"Missing data directory: {DATA_DIR}")
+        return None
+
+    config = dict(
+        kwargs,
+        critical_labs=kwargs.get("critical_labs") or CRITICAL_LABS,
+        lab_ranges=LAB_REFERENCE_RANGES if kwargs.get("lab_ranges") is None else kwargs["lab_ranges"],
+        vital_columns=VITAL_COLUMNS,
+    )
+    fingerprint = source_fingerprint(
+        DATA_DIR, hash_contents=hash_contents, cache_format=CACHE_FORMAT, **config
+    )
+    cache_file = cache_dir / f"complete_patient_data-{fingerprint}.feather"
+    if cache_file.exists() and not refresh:
+        print(f"Using cached dataset: {cache_file}")
+        return cache_file
+
+    complete_data = load_complete_patient_data(**kwargs)
+    if complete_data is None:
+        return None
+
+    # Uncompressed Feather so the server can memory-map it on warm starts
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp_file = cache_file.with_suffix(".feather.tmp")
+    complete_data.to_feather(tmp_file, compression="uncompressed")
+    os.replace(tmp_file, cache_file)
+    for stale in cache_dir.glob("complete_patient_data-*.feather"):
+        if stale != cache_file:
+            stale.unlink()
+    print(f"Cached dataset: {cache_file}")
+    return cache_file
+
+
+class PandasMCPServerBuilder(PandasMCPServerBuilder):
+    """PandasMCPServerBuilder that can also serve the Feather/Parquet cache"""
+
+    def _load_dataframe(self):
+        """Load CSV as usual; memory-map Feather and read Parquet directly"""
+        suffix = Path(self.csv_file_path).suffix
+        if suffix not in (".arrow", ".ipc", ".feather", ".parquet"):
+            return super()._load_dataframe()
+        try:
+            if suffix == ".parquet":
+                self.df = pd.read_parquet(self.csv_file_path)
+            else:
+                from pyarrow import feather
+
+                self.df = feather.read_table(self.csv_file_path, memory_map=True).to_pandas()
+            if self.initial_rows:
+                self.df = self.df.head(self.initial_rows)
+            print(f"Pandas DataFrame loaded successfully from {self.csv_file_path} with shape {self.df.shape}.")
+        except Exception as e:
+            print(f"Error loading Pandas DataFrame: {e}")
+            self.df = None
+
+    RANGE_OPERATORS = {
+        ">": lambda text, value: text > value,
+        "<": lambda text, value: text < value,
+        ">=": lambda text, value: text >= value,
+        "<=": lambda text, value: text <= value,
+    }
+
+    def _filter_df_rows(self, column: str, operator: str, value) -> str:
+        """Range operators on compacted category columns compare the values as text
+
+        compact_dtypes stores low-cardinality strings as unordered categoricals,
+        which only support equality; this keeps '>' / '<' working as they did
+        on the original string column. Everything else goes to the base filter.
+        """
+        compare = self.RANGE_OPERATORS.get(operator)
+        if (
+            compare is None
+            or self.df is None
+            or column not in self.df.columns
+            or not isinstance(self.df[column].dtype, pd.CategoricalDtype)
+        ):
+            return super()._filter_df_rows(column, operator, value)
+        text = self.df[column].astype("string")
+        mask = compare(text, str(value)).fillna(False).astype(bool)
+        return self._df_to_json(self.df[mask])
+
+    def _df_to_json(self, df_subset: "pd.DataFrame") -> str:
+        """Records JSON with float32 columns written at their shortest decimal form"""
+        float32_cols = df_subset.select_dtypes("float32").columns
+        if len(float32_cols):
+            # str() of a float32 is its shortest repr (72.29, not 72.2900009155)
+            df_subset = df_subset.astype({col: str for col in float32_cols}).astype(
+                {col: "float64" for col in float32_cols}
+            )
+        return df_subset.to_json(orient="records", indent=2)
+
+
 def main():
+    parser = argparse.ArgumentParser(description="eICU MCP data server (Pandas)")
+    parser.add_argument("--refresh-cache", action="store_true", help="rebuild the merged table even if the cache is fresh")
+    parser.add_argument("--hash-contents", action="store_true", help="include file contents in the cache fingerprint")
+    parser.add_argument("--export-csv", action="store_true", help="also write the merged table to complete_patient_data.csv")
+    args = parser.parse_args()
+
     if not PANDAS_AVAILABLE:
         print("Need pandas: pip install pandas")
         sys.exit(1)
 
-    # Load complete data (including actual outcomes)
-    complete_data = load_complete_patient_data()
-    if complete_data is None:
+    # Load complete data (including actual outcomes), reusing the cache when fresh
+    data_file = load_cached_patient_data(
+        hash_contents=args.hash_contents, refresh=args.refresh_cache
+    )
+    if data_file is None:
         sys.exit(1)
-
-    print("Available columns:")
-    for col in complete_data.columns:
-        print(f"  {col}")
-
-    # Save complete data for MCP server
-    temp_file = "complete_patient_data.csv"
-    complete_data.to_csv(temp_file, index=False)
+    if args.export_csv:
+        # Save complete data as CSV for inspection
+        pd.read_feather(data_file).to_csv("complete_patient_data.csv", index=False)
+        print("Wrote complete_patient_data.csv")
 
     # Setup MCP server with complete data
     server = PandasMCPServerBuilder(
         server_name="CompleteMedicalDataServer",
-        csv_file_path=temp_file,
+        csv_file_path=str(data_file),
         stateless_http=True,
     )
 
@@ -138,6 +479,10 @@ def main():
         print("Failed to create server")
         sys.exit(1)
 
+    print("Available columns:")
+    for col in server.df.columns:
+        print(f"  {col}")
+
     print(f"\nMCP Server ready with {len(server.df)} patients")
     print("Server URL: http://localhost:8000/mcp")
     print("Operations: filter_rows (by patient ID), get_schema, get_head")
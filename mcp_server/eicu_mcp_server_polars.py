@@ -3,23 +3,124 @@ MCP Server for eICU Medical Data using Polars - FIXED VERSION
 Loads all patient files and serves complete patient data (including actual outcomes)
 """
 import os
+import re
 import sys
+import json
+import base64
+import hashlib
+import time
+import argparse
+import functools
+import threading
+import contextlib
+import contextvars
+import numpy as np
 import polars as pl
 from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
 from intelli.mcp import PolarsMCPServerBuilder, POLARS_AVAILABLE
+from partition_eicu_data import (
+    DEFAULT_PARTITIONS, PARTITION_DIR, PartitionedDataset, partition_dataset, scan_event_csv,
+)
 
+DATA_DIR = Path("eicu_demo_data")
+CACHE_DIR = Path("cache")
 
-def load_complete_patient_data():
-    """Load and merge all patient data files including actual outcomes using Polars"""
-    data_dir = Path("eicu_demo_data")
+SOURCE_FILES = {
+    "patient": "patient.csv",
+    "apache_result": "apachePatientResult.csv",
+    "apache_vars": "apacheApsVar.csv",
+    "labs": "lab.csv",
+    "vitals": "vitalPeriodic.csv",
+}
 
-    files = {
-        "patient": "patient.csv",
-        "apache_result": "apachePatientResult.csv",
-        "apache_vars": "apacheApsVar.csv",
-        "labs": "lab.csv",
-        "vitals": "vitalPeriodic.csv",
-    }
+# Critical lab flags: flag name (served as has_<name>) -> lowercase substring
+# matched against labname. Add entries here to flag more labs.
+CRITICAL_LABS = {
+    "wbc": "wbc",
+    "creatinine": "creatinine",
+    "lactate": "lactate",
+    "bilirubin": "bilirubin",
+    "glucose": "glucose",
+}
+
+# Labs summarised per patient as lab_<name>_first/_last/_min/_max/_abnormal_count.
+# Keys are labname values in lab.csv (the whitelist); values are the adult
+# reference range (low, high), either side None when one-sided.
+LAB_REFERENCE_RANGES = {
+    "sodium": (135, 145),
+    "potassium": (3.5, 5.1),
+    "chloride": (98, 107),
+    "bicarbonate": (22, 29),
+    "BUN": (7, 20),
+    "creatinine": (0.6, 1.3),
+    "glucose": (70, 140),
+    "bedside glucose": (70, 140),
+    "calcium": (8.5, 10.5),
+    "magnesium": (1.7, 2.2),
+    "phosphate": (2.5, 4.5),
+    "albumin": (3.5, 5.0),
+    "total bilirubin": (0.1, 1.2),
+    "lactate": (0.5, 2.0),
+    "Hgb": (12, 17.5),
+    "Hct": (36, 50),
+    "WBC x 1000": (4, 11),
+    "platelets x 1000": (150, 400),
+    "PT - INR": (0.8, 1.2),
+    "pH": (7.35, 7.45),
+    "paCO2": (35, 45),
+    "paO2": (80, 100),
+    "troponin - I": (None, 0.04),
+}
+
+LAB_STATS = ["first", "last", "min", "max", "abnormal_count"]
+
+# Vital signs summarised per patient as <name>_mean / <name>_max
+VITAL_COLUMNS = ["heartrate", "systemicsystolic", "temperature"]
+
+# Vital signs that get time-windowed features (see vitals_window_query)
+VITAL_WINDOW_COLUMNS = ["heartrate", "systemicsystolic", "systemicdiastolic", "temperature", "sao2"]
+
+# Minutes between vitalPeriodic rows when the file has no observationoffset
+VITALS_CADENCE_MINUTES = 5
+
+# Label columns; the "features" view never returns them
+OUTCOME_COLUMNS = ["actualicumortality", "actualiculos", "expired"]
+
+# Marks a tool result that carries a base64 Arrow IPC stream instead of JSON
+ARROW_IPC_PREFIX = "arrow-ipc;base64,"
+
+# Bump when the cached table layout changes so old caches are rebuilt
+CACHE_FORMAT = 4
+
+
+def load_complete_patient_data(
+    streaming: bool = True,
+    critical_labs: dict = None,
+    compact: bool = True,
+    lab_ranges: dict = None,
+    parallel: bool = True,
+    use_partitions: bool = True,
+):
+    """Load and merge all patient data files including actual outcomes using Polars
+
+    The whole merge is expressed as a single lazy query over ``pl.scan_csv``
+    sources. With ``streaming=True`` the plan runs on the streaming engine, so
+    the raw lab and vitals tables are processed in batches and peak memory is
+    bounded by the merged output rather than the input files. With
+    ``parallel=True`` the independent per-source pre-aggregates are collected
+    concurrently with ``pl.collect_all`` (which also scans a file shared by
+    several of them only once) and only the small per-patient results are
+    joined, so cold-start time follows the slowest source rather than the
+    sum. If one source fails, the others are collected on their own and it
+    is left out, as on the single-plan path. ``compact`` applies the dtype
+    plan from ``plan_dtypes``. ``lab_ranges`` overrides ``LAB_REFERENCE_RANGES``
+    (an empty dict skips the per-lab summaries). With ``use_partitions`` the
+    lab and vitals tables are scanned from the Parquet layout written by
+    partition_eicu_data.py when it is up to date with the CSVs.
+    """
+    data_dir = DATA_DIR
+    files = SOURCE_FILES
 
     # Check files exist
     missing = []
@@ -31,82 +132,194 @@ def load_complete_patient_data():
         print(f"Missing files: {missing}")
         return None
 
-    # Load core data
-    patient_df = pl.read_csv(data_dir / files["patient"])
-    apache_df = pl.read_csv(data_dir / files["apache_result"])
-    apache_vars_df = pl.read_csv(data_dir / files["apache_vars"])
+    critical_labs = critical_labs or CRITICAL_LABS
+    engine = "streaming" if streaming else "auto"
+    sources = build_source_queries(
+        data_dir,
+        files,
+        critical_labs,
+        lab_ranges=LAB_REFERENCE_RANGES if lab_ranges is None else lab_ranges,
+        partitions=PartitionedDataset.load(PARTITION_DIR) if use_partitions else None,
+    )
+    if parallel:
+        try:
+            collected = pl.collect_all(list(sources.values()), engine=engine)
+            sources = {name: df.lazy() for name, df in zip(sources, collected)}
+        except Exception as e:
+            # collect_all fails as a batch; retry one by one so only the bad source is lost
+            print(f"Error collecting sources together: {e}; collecting each source separately")
+            sources = collect_each_source(sources, engine)
+    try:
+        merged_df = join_patient_sources(sources, critical_labs).collect(engine=engine)
+    except Exception as e:
+        # A bad lab or vitals file only fails when the plan runs; isolate it
+        print(f"Error loading merged table: {e}; collecting each source separately")
+        sources = collect_each_source(sources, engine)
+        merged_df = join_patient_sources(sources, critical_labs).collect(engine=engine)
+    if compact:
+        merged_df = compact_dtypes(merged_df)
+
+    print(
+        f"Loaded complete dataset: {merged_df.height} patients with {merged_df.width} features"
+    )
+    print(
+        "Dataset includes actual outcomes - preprocessor will clean data for prediction"
+    )
+
+    return merged_df
+
+
+def collect_each_source(sources: Dict[str, pl.LazyFrame], engine: str = "auto") -> Dict[str, pl.LazyFrame]:
+    """Collect the sources one at a time, leaving out (and reporting) each optional one that fails
+
+    The core patient/APACHE table is required, so its error propagates.
+    """
+    collected = {}
+    for name, lf in sources.items():
+        try:
+            collected[name] = lf.collect(engine=engine).lazy()
+        except Exception as e:
+            if name == "core":
+                raise
+            print(f"Error processing {name}: {e}")
+    return collected
+
+
+def build_patient_query(
+    data_dir: Path,
+    files: dict,
+    critical_labs: dict = CRITICAL_LABS,
+    vitals_windows: bool = True,
+    lab_ranges: dict = LAB_REFERENCE_RANGES,
+) -> pl.LazyFrame:
+    """Build the lazy query plan that produces the merged patient table"""
+    sources = build_source_queries(data_dir, files, critical_labs, vitals_windows, lab_ranges)
+    return join_patient_sources(sources, critical_labs)
+
+
+def build_source_queries(
+    data_dir: Path,
+    files: dict,
+    critical_labs: dict = CRITICAL_LABS,
+    vitals_windows: bool = True,
+    lab_ranges: dict = LAB_REFERENCE_RANGES,
+    partitions: Optional[PartitionedDataset] = None,
+) -> Dict[str, pl.LazyFrame]:
+    """Independent per-source queries, each keyed by patientunitstayid
+
+    "core" is the patient/APACHE merge; the others are per-patient lab and
+    vitals pre-aggregates. None of them depend on each other, so they can be
+    collected concurrently before ``join_patient_sources``. A source that
+    fails to plan is left out and reported. Lab and vitals rows come from
+    ``partitions`` when it holds a fresh copy of the table.
+    """
+    # Scan core data
+    patient_lf = pl.scan_csv(data_dir / files["patient"])
+    apache_lf = pl.scan_csv(data_dir / files["apache_result"])
+    apache_vars_lf = pl.scan_csv(data_dir / files["apache_vars"])
 
     # Remove duplicates from Apache data to prevent duplicate rows after merge
-    apache_df = apache_df.unique(subset=["patientunitstayid"])
-    apache_vars_df = apache_vars_df.unique(subset=["patientunitstayid"])
+    apache_lf = apache_lf.unique(subset=["patientunitstayid"], keep="first")
+    apache_vars_lf = apache_vars_lf.unique(subset=["patientunitstayid"], keep="first")
 
     # Merge core data using Polars joins
-    merged_df = patient_df.join(apache_df, on="patientunitstayid", how="left")
-    merged_df = merged_df.join(apache_vars_df, on="patientunitstayid", how="left")
+    core_lf = patient_lf.join(
+        apache_lf, on="patientunitstayid", how="left", maintain_order="left"
+    )
+    core_lf = core_lf.join(
+        apache_vars_lf, on="patientunitstayid", how="left", maintain_order="left"
+    )
+    sources = {"core": core_lf}
 
-    # Add lab counts per patient
+    # Lab counts and matched critical lab patterns per patient
     try:
-        labs_df = pl.read_csv(data_dir / files["labs"])
-        if labs_df.height > 0:
-            # Get lab counts using Polars group_by
-            lab_counts = (
-                labs_df.group_by("patientunitstayid")
-                .len()
-                .rename({"len": "lab_count"})
-            )
-            merged_df = merged_df.join(lab_counts, on="patientunitstayid", how="left")
-
-            # Add critical lab flags
-            critical_labs = ["wbc", "creatinine", "lactate", "bilirubin", "glucose"]
-            for lab in critical_labs:
-                lab_patients = labs_df.filter(
-                    pl.col("labname").str.to_lowercase().str.contains(lab)
-                )["patientunitstayid"].unique().to_list()  # Convert to list explicitly
-                
-                merged_df = merged_df.with_columns(
-                    pl.col("patientunitstayid").is_in(lab_patients).alias(f"has_{lab}")
-                )
+        labs_lf = scan_source(data_dir, files, "labs", partitions)
+        if "labname" not in labs_lf.collect_schema():
+            raise ValueError("lab file has no 'labname' column")
+
+        # Classify every lab row against all patterns in one pass, keeping the
+        # distinct matched patterns per patient; flags are derived after the
+        # join on the (much smaller) per-patient table.
+        sources["lab_stats"] = labs_lf.group_by("patientunitstayid").agg(
+            pl.len().alias("lab_count"),
+            critical_hits_expr(critical_labs),
+        )
     except Exception as e:
         print(f"Error processing labs: {e}")
-        merged_df = merged_df.with_columns(pl.lit(0).alias("lab_count"))
 
-    # Add vitals stats per patient
+    # Per-lab summaries are optional; a failure here must not drop lab_stats
+    if lab_ranges and "lab_stats" in sources:
+        try:
+            sources["lab_summary"] = lab_pivot_query(labs_lf, lab_ranges)
+        except Exception as e:
+            print(f"Error building per-lab summaries: {e}")
+
+    # Vitals stats per patient
     try:
-        vitals_df = pl.read_csv(data_dir / files["vitals"])
-        if vitals_df.height > 0:
-            # Check which numeric columns actually exist
-            available_numeric_cols = []
-            for col in ["heartrate", "systemicsystolic", "temperature"]:
-                if col in vitals_df.columns:
-                    # Check if column is numeric or can be converted
-                    try:
-                        if vitals_df[col].dtype.is_numeric():
-                            available_numeric_cols.append(col)
-                        else:
-                            # Try to convert to numeric
-                            vitals_df = vitals_df.with_columns(
-                                pl.col(col).cast(pl.Float64, strict=False).alias(col)
-                            )
-                            available_numeric_cols.append(col)
-                    except:
-                        print(f"Warning: Could not process vitals column {col}")
-            
-            if available_numeric_cols:
-                # Build aggregation expressions dynamically
-                agg_exprs = []
-                for col in available_numeric_cols:
-                    agg_exprs.extend([
-                        pl.col(col).mean().round(2).alias(f"{col}_mean"),
-                        pl.col(col).max().alias(f"{col}_max"),
-                    ])
-                
-                vitals_stats = vitals_df.group_by("patientunitstayid").agg(agg_exprs)
-                merged_df = merged_df.join(vitals_stats, on="patientunitstayid", how="left")
+        vitals_lf = scan_source(data_dir, files, "vitals", partitions)
+        vitals_schema = vitals_lf.collect_schema()
+
+        # Check which numeric columns actually exist
+        available_numeric_cols = []
+        for col in VITAL_COLUMNS:
+            if col in vitals_schema:
+                if not vitals_schema[col].is_numeric():
+                    # Try to convert to numeric
+                    vitals_lf = vitals_lf.with_columns(
+                        pl.col(col).cast(pl.Float64, strict=False).alias(col)
+                    )
+                available_numeric_cols.append(col)
+
+        if available_numeric_cols:
+            # Build aggregation expressions dynamically
+            agg_exprs = []
+            for col in available_numeric_cols:
+                agg_exprs.extend([
+                    pl.col(col).mean().round(2).alias(f"{col}_mean"),
+                    pl.col(col).max().alias(f"{col}_max"),
+                ])
+            sources["vitals_stats"] = vitals_lf.group_by("patientunitstayid").agg(agg_exprs)
+
+        window_cols = [col for col in VITAL_WINDOW_COLUMNS if col in vitals_schema]
+        if vitals_windows and window_cols:
+            sources["vitals_windows"] = vitals_window_query(vitals_lf, window_cols, vitals_schema)
     except Exception as e:
         print(f"Error processing vitals: {e}")
 
+    return sources
+
+
+def scan_source(
+    data_dir: Path, files: dict, name: str, partitions: Optional[PartitionedDataset] = None
+) -> pl.LazyFrame:
+    """Scan a source table from the partitioned Parquet layout if fresh, else from its CSV"""
+    if partitions is not None and partitions.is_fresh(name, data_dir):
+        print(f"Reading {name} from {partitions.table_dir(name)}")
+        return partitions.scan(name)
+    return scan_event_csv(data_dir / files[name])
+
+
+def join_patient_sources(sources: Dict[str, pl.LazyFrame], critical_labs: dict = CRITICAL_LABS) -> pl.LazyFrame:
+    """Left-join the per-patient pre-aggregates onto the core table, in a fixed column order"""
+    merged_lf = sources["core"]
+    for name in ("lab_stats", "lab_summary", "vitals_stats", "vitals_windows"):
+        if name in sources:
+            merged_lf = merged_lf.join(
+                sources[name], on="patientunitstayid", how="left", maintain_order="left"
+            )
+        if name == "lab_stats" and name in sources:
+            merged_lf = merged_lf.with_columns(
+                pl.col("_critical_hits")
+                .list.contains(pattern)
+                .fill_null(False)
+                .alias(f"has_{lab}")
+                for lab, pattern in critical_labs.items()
+            ).drop("_critical_hits")
+        elif name == "lab_stats":
+            merged_lf = merged_lf.with_columns(pl.lit(0).alias("lab_count"))
+
     # Add convenient mortality flag (keep actual outcomes for comparison)
-    merged_df = merged_df.with_columns(
+    merged_lf = merged_lf.with_columns(
         pl.col("actualicumortality")
         .str.to_lowercase()
         .str.contains("expired")
@@ -114,21 +327,1836 @@ def load_complete_patient_data():
         .alias("expired")
     )
 
-    print(
-        f"Loaded complete dataset: {merged_df.height} patients with {merged_df.width} features"
+    return merged_lf
+
+
+def lab_feature_name(labname: str, stat: str) -> str:
+    """Served column name for one lab statistic, e.g. ("WBC x 1000", "max") -> lab_wbc_x_1000_max"""
+    slug = re.sub(r"[^0-9a-z]+", "_", labname.lower()).strip("_")
+    return f"lab_{slug}_{stat}"
+
+
+def lab_pivot_query(labs_lf: pl.LazyFrame, lab_ranges: dict) -> pl.LazyFrame:
+    """Wide per-patient lab summaries: one group_by over (patient, lab) and one pivot
+
+    Only labs named in ``lab_ranges`` are kept (an inner join against the
+    range table, so the whitelist costs one hash lookup per row). first/last
+    follow labresultoffset; abnormal_count counts results outside the
+    reference range. Patients without a given lab get nulls in its columns.
+    """
+    labnames = list(lab_ranges)
+    ranges = pl.LazyFrame(
+        {
+            "labname": labnames,
+            "_low": [lab_ranges[name][0] for name in labnames],
+            "_high": [lab_ranges[name][1] for name in labnames],
+        },
+        schema={"labname": pl.String, "_low": pl.Float64, "_high": pl.Float64},
+    )
+    value = pl.col("labresult").cast(pl.Float64, strict=False)
+    by_offset = value.sort_by("labresultoffset")
+    abnormal = (value < pl.col("_low")).fill_null(False) | (value > pl.col("_high")).fill_null(False)
+    summaries = (
+        labs_lf.join(ranges, on="labname", how="inner")
+        .group_by("patientunitstayid", "labname")
+        .agg(
+            by_offset.drop_nulls().first().alias("first"),
+            by_offset.drop_nulls().last().alias("last"),
+            value.min().alias("min"),
+            value.max().alias("max"),
+            abnormal.sum().alias("abnormal_count"),
+        )
     )
+    return summaries.pivot(
+        on="labname",
+        on_columns=labnames,
+        index="patientunitstayid",
+        values=LAB_STATS,
+    ).rename(
+        {f"{stat}_{name}": lab_feature_name(name, stat) for stat in LAB_STATS for name in labnames}
+    )
+
+
+def vitals_window_query(
+    vitals_lf: pl.LazyFrame, columns: list, schema=None, cadence_minutes: int = VITALS_CADENCE_MINUTES
+) -> pl.LazyFrame:
+    """Per-patient time-windowed vitals features, one sort and one group_by over the table
+
+    For each vital: mean over the first 24h and the last 6h of the stay, the
+    least-squares slope per hour, and the min/max of the 1-hour rolling mean.
+    Time is observationoffset (minutes from unit admission) when the file has
+    it; otherwise rows are assumed to be ``cadence_minutes`` apart in file
+    order, as in the eICU demo extract.
+    """
+    schema = schema or vitals_lf.collect_schema()
+    if "observationoffset" in schema:
+        offset = pl.col("observationoffset").cast(pl.Int64)
+    else:
+        print(
+            f"vitals have no observationoffset; assuming {cadence_minutes}-minute spacing in file order"
+        )
+        offset = pl.int_range(pl.len()).over("patientunitstayid") * cadence_minutes
+
+    timed = (
+        vitals_lf.select(
+            pl.col("patientunitstayid"),
+            offset.alias("_offset"),
+            *[pl.col(col).cast(pl.Float64, strict=False) for col in columns],
+        )
+        .sort("patientunitstayid", "_offset")
+        .with_columns(
+            # Mean over the readings present in each window: rolling sums of the
+            # values and of the non-null count (rolling_*_by rejects nulls before
+            # polars 2.0, so they are zero-filled and counted out)
+            (
+                pl.col(col).fill_null(0).rolling_sum_by("_offset", window_size="60i")
+                / pl.col(col).is_not_null().cast(pl.Int64).rolling_sum_by("_offset", window_size="60i")
+            )
+            .fill_nan(None)
+            .over("patientunitstayid")
+            .alias(f"_{col}_roll1h")
+            for col in columns
+        )
+    )
+
+    hours = pl.col("_offset") / 60
+    first_24h = pl.col("_offset") < pl.col("_offset").min() + 24 * 60
+    last_6h = pl.col("_offset") >= pl.col("_offset").max() - 6 * 60
+    features = []
+    for col in columns:
+        value = pl.col(col)
+        observed = value.is_not_null()
+        features.extend([
+            value.filter(first_24h).mean().alias(f"{col}_first24h_mean"),
+            value.filter(last_6h).mean().alias(f"{col}_last6h_mean"),
+            pl.cov(hours.filter(observed), value.filter(observed))
+            .truediv(hours.filter(observed).var())
+            .fill_nan(None)
+            .alias(f"{col}_slope_per_hour"),
+            pl.col(f"_{col}_roll1h").min().alias(f"{col}_roll1h_min"),
+            pl.col(f"_{col}_roll1h").max().alias(f"{col}_roll1h_max"),
+        ])
+    return (
+        timed.group_by("patientunitstayid")
+        .agg(features)
+        .with_columns(pl.exclude("patientunitstayid").round(2))
+    )
+
+
+def critical_hits_expr(critical_labs: dict = CRITICAL_LABS) -> pl.Expr:
+    """Aggregation: distinct critical-lab patterns matched by a patient's lab names"""
+    patterns = list(dict.fromkeys(critical_labs.values()))
+    return (
+        pl.col("labname")
+        .str.to_lowercase()
+        .str.extract_many(patterns, overlapping=True)
+        .explode()
+        .drop_nulls()
+        .unique()
+        .alias("_critical_hits")
+    )
+
+
+# Signed integer types from narrowest to widest, with their value ranges
+INTEGER_DTYPES = [(dtype, -(2 ** (bits - 1)), 2 ** (bits - 1) - 1)
+                  for dtype, bits in ((pl.Int8, 8), (pl.Int16, 16), (pl.Int32, 32), (pl.Int64, 64))]
+
+
+def smallest_integer_dtype(low: int, high: int):
+    """Smallest signed integer dtype holding [low, high], or None if even Int64 does not"""
+    for dtype, lowest, highest in INTEGER_DTYPES:
+        if lowest <= low and high <= highest:
+            return dtype
+    return None
+
+
+def plan_dtypes(df: pl.DataFrame, max_categories: int = 256, category_ratio: float = 0.5) -> dict:
+    """Choose compact dtypes for the merged table; returns {column: dtype} for columns to cast
+
+    - integers (ids, counts, vitals maxima): smallest signed type holding the range
+    - strings with few distinct values: Enum over the sorted values
+    - float vitals aggregates and windowed features (<vital>_*): Float32
+    - float lab summaries (lab_<name>_first/_last/_min/_max): Float32
+    Booleans (the has_* flags) are already bit-packed by Arrow and stay as they are.
+    """
+    vital_prefixes = tuple(f"{col}_" for col in {*VITAL_COLUMNS, *VITAL_WINDOW_COLUMNS})
+    plan = {}
+    for name, dtype in df.schema.items():
+        series = df[name]
+        if dtype.is_integer():
+            low, high = series.min(), series.max()
+            if low is None:
+                continue
+            candidate = smallest_integer_dtype(low, high)
+            if candidate is not None and candidate != dtype:
+                plan[name] = candidate
+        elif dtype == pl.String:
+            categories = series.drop_nulls().unique().sort()
+            if len(categories) <= min(max_categories, max(1, category_ratio * df.height)):
+                plan[name] = pl.Enum(categories.to_list())
+        elif dtype == pl.Float64 and name.startswith((*vital_prefixes, "lab_")):
+            plan[name] = pl.Float32
+    return plan
+
+
+def compact_dtypes(df: pl.DataFrame, **plan_options) -> pl.DataFrame:
+    """Apply plan_dtypes and report the memory before and after"""
+    plan = plan_dtypes(df, **plan_options)
+    if not plan:
+        return df
+    before = df.estimated_size()
+    compacted = df.with_columns(pl.col(name).cast(dtype) for name, dtype in plan.items())
+    after = compacted.estimated_size()
     print(
-        "Dataset includes actual outcomes - preprocessor will clean data for prediction"
+        f"Dtype plan: {before / 1024:.1f} KiB -> {after / 1024:.1f} KiB "
+        f"({1 - after / before:.0%} smaller)"
     )
+    # One line per dtype change; the wide lab/vitals tables would otherwise print hundreds
+    groups = {}
+    for name, dtype in plan.items():
+        groups.setdefault(f"{df.schema[name]} -> {dtype}", []).append(name)
+    for change, names in groups.items():
+        shown = ", ".join(names[:4]) + (f", ... ({len(names)} columns)" if len(names) > 4 else "")
+        print(f"  {change}: {shown}")
+    return compacted
 
-    return merged_df
+
+def source_fingerprint(
+    data_dir: Path = DATA_DIR, hash_contents: bool = False, exclude=(), **config
+) -> str:
+    """Fingerprint every file in the data directory plus the loader config
+
+    Size and mtime catch normal edits and re-extracts; ``hash_contents=True``
+    additionally hashes the bytes for copies that preserve mtimes. File names
+    in ``exclude`` are skipped.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps(config, sort_keys=True, default=str).encode())
+    for path in sorted(p for p in data_dir.iterdir() if p.is_file() and p.name not in exclude):
+        stat = path.stat()
+        digest.update(f"{path.name}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+        if hash_contents:
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def load_cached_patient_data(
+    cache_dir: Path = CACHE_DIR, hash_contents: bool = False, refresh: bool = False, keep=(), **kwargs
+):
+    """Return the path of an Arrow IPC cache of the merged table, building it if stale
+
+    The cache file name embeds the source fingerprint, so any change to the
+    files in ``eicu_demo_data/`` (or to the loader arguments) misses the cache
+    and triggers one ETL run. The key also covers CACHE_FORMAT and the
+    effective lab tables and vitals columns, so editing CRITICAL_LABS or
+    LAB_REFERENCE_RANGES rebuilds too. Older cache files are removed after a
+    rebuild, except those in ``keep`` (e.g. the file workers are still serving).
+    """
+    if not DATA_DIR.is_dir():
+        print(f"Missing data directory: {DATA_DIR}")
+        return None
+
+    config = dict(
+        kwargs,
+        critical_labs=kwargs.get("critical_labs") or CRITICAL_LABS,
+        lab_ranges=LAB_REFERENCE_RANGES if kwargs.get("lab_ranges") is None else kwargs["lab_ranges"],
+        vital_columns=VITAL_COLUMNS,
+        vital_window_columns=VITAL_WINDOW_COLUMNS,
+    )
+    fingerprint = source_fingerprint(
+        DATA_DIR, hash_contents=hash_contents, cache_format=CACHE_FORMAT, **config
+    )
+    cache_file = cache_dir / f"complete_patient_data_polars-{fingerprint}.arrow"
+    if cache_file.exists() and not refresh:
+        print(f"Using cached dataset: {cache_file}")
+        return cache_file
+
+    complete_data = load_complete_patient_data(**kwargs)
+    if complete_data is None:
+        return None
+
+    # Uncompressed IPC so the server can memory-map it on warm starts
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    # Write under a temp name and rename, so readers never map a partial file
+    tmp_file = cache_file.with_suffix(f".arrow.{os.getpid()}.tmp")
+    complete_data.write_ipc(tmp_file, compression="uncompressed")
+    os.replace(tmp_file, cache_file)
+    keep = {cache_file, *(Path(path) for path in keep)}
+    for stale in cache_dir.glob("complete_patient_data_polars-*.arrow"):
+        if stale not in keep:
+            stale.unlink()
+    print(f"Cached dataset: {cache_file}")
+    return cache_file
+
+
+# Multi-worker serving: the parent process owns the ETL and names the cache
+# file to serve here; workers only watch this file and re-map what it names.
+CACHE_POINTER = CACHE_DIR / "current_polars.txt"
+POINTER_POLL_SECONDS = 1.0
+
+
+def publish_cache_file(data_file, pointer: Path = CACHE_POINTER):
+    """Point the workers at data_file (written to a temp file and renamed, so never half-written)"""
+    pointer.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = pointer.with_suffix(f".{os.getpid()}.tmp")
+    tmp_file.write_text(str(data_file))
+    os.replace(tmp_file, pointer)
+
+
+def read_cache_pointer(pointer: Path = CACHE_POINTER) -> Optional[str]:
+    """Cache file the parent currently publishes, or None if there is none"""
+    try:
+        return pointer.read_text().strip() or None
+    except OSError:
+        return None
+
+
+def request_parent_rebuild():
+    """Worker side of reload_data: ask the parent to rebuild (see watch_and_publish)"""
+    import signal
+
+    os.kill(os.getppid(), signal.SIGHUP)
+
+
+def watch_and_publish(
+    data_file, rebuild: threading.Event, interval: float = 0, hash_contents: bool = False,
+    pointer: Path = CACHE_POINTER,
+):
+    """Parent side of multi-worker serving: the only watcher and the only ETL
+
+    Rebuilds the cache when the source data changes (checked every interval
+    seconds, if > 0) or when rebuild is set, then publishes the new file.
+    The previously published file is kept for workers still switching over.
+    Runs until the process exits.
+    """
+    published = str(data_file)
+    fingerprint = functools.partial(source_fingerprint, DATA_DIR, hash_contents=hash_contents)
+    last = fingerprint()
+    while True:
+        requested = rebuild.wait(interval if interval > 0 else None)
+        try:
+            current = fingerprint()
+            if not requested and current == last:
+                continue
+            rebuild.clear()
+            data_file = load_cached_patient_data(hash_contents=hash_contents, keep=[published])
+            last = current
+            if data_file is not None and str(data_file) != published:
+                publish_cache_file(data_file, pointer)
+                published = str(data_file)
+                print(f"Published {data_file} to the workers")
+        except Exception as e:
+            print(f"Error rebuilding data: {e}")
+
+
+class IncrementalIngestor:
+    """Running per-patient lab and vitals aggregates fed by rows appended to the raw CSVs
+
+    lab.csv and vitalPeriodic.csv are tailed from the byte offset reached by
+    the previous pass, consuming only complete lines. New rows are folded into
+    the running state (lab count, matched critical labs, vitals sum/count/max)
+    and ``poll`` returns the recomputed served columns for the touched
+    patients only. ``initialize`` builds the state with one pass over the
+    existing files, read in bounded chunks. The windowed vitals features (``vitals_window_query``)
+    and per-lab summaries (``lab_pivot_query``) are not maintained here;
+    they are refreshed on the next reload.
+    """
+
+    def __init__(
+        self, data_dir: Path = DATA_DIR, files: dict = SOURCE_FILES, critical_labs: dict = None,
+        chunk_bytes: int = 4 * 1024 * 1024,
+    ):
+        self.data_dir = Path(data_dir)
+        self.files = files
+        self.critical_labs = critical_labs or CRITICAL_LABS
+        self.chunk_bytes = chunk_bytes
+        self.offsets = {}
+        self.headers = {}
+        self.vital_columns = []
+        self.lab_state = {}    # patientunitstayid -> [lab_count, set of matched patterns]
+        self.vital_state = {}  # patientunitstayid -> {vital: [sum, count, max]}
+
+    def initialize(self) -> pl.DataFrame:
+        """Read both files from the start and return served columns for every patient
+
+        Applying the result once brings a table loaded from an older cache in
+        line with the state before the first poll.
+        """
+        self.offsets, self.headers = {}, {}
+        self.lab_state, self.vital_state = {}, {}
+        self.poll()
+        patients = sorted(self.lab_state.keys() | self.vital_state.keys())
+        print(f"Incremental state: {len(patients)} patients, offsets {self.offsets}")
+        return self._served_rows(patients)
+
+    def poll(self):
+        """Fold newly appended rows into the state
+
+        Returns (updates, summary): a frame of served columns keyed by
+        patientunitstayid for every affected patient (None when nothing new
+        arrived) and row counts per file.
+        """
+        touched, lab_rows, vital_rows = set(), 0, 0
+        for rows in self._read_new_rows("labs"):
+            touched |= self._fold_labs(rows)
+            lab_rows += rows.height
+        for rows in self._read_new_rows("vitals"):
+            touched |= self._fold_vitals(rows)
+            vital_rows += rows.height
+        summary = {"lab_rows": lab_rows, "vital_rows": vital_rows, "patients_touched": len(touched)}
+        return (self._served_rows(sorted(touched)) if touched else None), summary
+
+    def _read_new_rows(self, key: str):
+        """Complete lines appended to a source file since the last pass, all as strings
+
+        Yields frames of at most about ``chunk_bytes`` of input each, cut on
+        line boundaries, so a first pass over a large file holds one chunk at
+        a time rather than the whole file. The offset advances per chunk.
+        """
+        path = self.data_dir / self.files[key]
+        offset = self.offsets.get(key, 0)
+        size = path.stat().st_size
+        if size < offset:
+            raise RuntimeError(f"{path} shrank since the last pass; reload the full dataset")
+        with open(path, "rb") as f:
+            f.seek(offset)
+            pending = b""
+            while f.tell() < size:
+                block = pending + f.read(min(self.chunk_bytes, size - f.tell()))
+                # A partially written last line stays for the next chunk or pass
+                end = block.rfind(b"\n") + 1
+                data, pending = block[:end], block[end:]
+                if not data:
+                    continue
+                offset += end
+                self.offsets[key] = offset
+                if key not in self.headers:
+                    header, _, data = data.partition(b"\n")
+                    self.headers[key] = pl.read_csv(header + b"\n", n_rows=0).columns
+                    if key == "vitals":
+                        self.vital_columns = [col for col in VITAL_COLUMNS if col in self.headers[key]]
+                if data.strip():
+                    yield pl.read_csv(data, has_header=False, new_columns=self.headers[key], infer_schema=False)
+
+    def _fold_labs(self, rows) -> set:
+        if rows is None or "labname" not in rows.columns:
+            return set()
+        stats = (
+            rows.with_columns(pl.col("patientunitstayid").cast(pl.Int64, strict=False))
+            .drop_nulls("patientunitstayid")
+            .group_by("patientunitstayid")
+            .agg(pl.len().alias("lab_count"), critical_hits_expr(self.critical_labs))
+        )
+        for pid, count, hits in stats.iter_rows():
+            state = self.lab_state.setdefault(pid, [0, set()])
+            state[0] += count
+            state[1].update(hits)
+        return set(stats["patientunitstayid"].to_list())
+
+    def _fold_vitals(self, rows) -> set:
+        if rows is None or not self.vital_columns:
+            return set()
+        cols = self.vital_columns
+        stats = (
+            rows.select(
+                pl.col("patientunitstayid").cast(pl.Int64, strict=False),
+                *[pl.col(col).cast(pl.Float64, strict=False) for col in cols],
+            )
+            .drop_nulls("patientunitstayid")
+            .group_by("patientunitstayid")
+            .agg(
+                expr
+                for col in cols
+                for expr in (
+                    pl.col(col).sum().alias(f"{col}_sum"),
+                    pl.col(col).count().alias(f"{col}_count"),
+                    pl.col(col).max().alias(f"{col}_max"),
+                )
+            )
+        )
+        for row in stats.iter_rows(named=True):
+            state = self.vital_state.setdefault(
+                row["patientunitstayid"], {col: [0.0, 0, None] for col in cols}
+            )
+            for col in cols:
+                entry = state[col]
+                entry[0] += row[f"{col}_sum"]
+                entry[1] += row[f"{col}_count"]
+                new_max = row[f"{col}_max"]
+                if new_max is not None and (entry[2] is None or new_max > entry[2]):
+                    entry[2] = new_max
+        return set(stats["patientunitstayid"].to_list())
+
+    def _served_rows(self, pids: list) -> pl.DataFrame:
+        """Served lab/vitals columns for pids, computed from the running state"""
+        columns = {"patientunitstayid": pids, "lab_count": []}
+        columns.update({f"has_{lab}": [] for lab in self.critical_labs})
+        for col in self.vital_columns:
+            columns[f"{col}_mean"], columns[f"{col}_max"] = [], []
+        for pid in pids:
+            count, hits = self.lab_state.get(pid, (None, ()))
+            columns["lab_count"].append(count)
+            for lab, pattern in self.critical_labs.items():
+                columns[f"has_{lab}"].append(pattern in hits)
+            vitals = self.vital_state.get(pid, {})
+            for col in self.vital_columns:
+                total, n, peak = vitals.get(col, (0.0, 0, None))
+                columns[f"{col}_mean"].append(total / n if n else None)
+                columns[f"{col}_max"].append(peak)
+        schema = {"patientunitstayid": pl.Int64, "lab_count": pl.Int64}
+        schema.update({f"has_{lab}": pl.Boolean for lab in self.critical_labs})
+        schema.update({name: pl.Float64 for name in columns if name not in schema})
+        return pl.DataFrame(columns, schema=schema).with_columns(pl.col(f"{col}_mean").round(2) for col in self.vital_columns)
+
+
+# Time column per raw table; vitals without one get it derived from row order
+RAW_SERIES_TIME_COLUMNS = {"vitals": "observationoffset", "labs": "labresultoffset"}
+
+DOWNSAMPLE_METHODS = ("lttb", "minmax")
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: positions of n_out points that keep the visual shape
+
+    x must be sorted. The first and last points are always kept; each bucket
+    in between contributes the point forming the largest triangle with the
+    previously kept point and the mean of the next bucket.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n) if n_out >= n else np.array([0, n - 1][:max(n_out, 0)], dtype=np.int64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    kept = np.empty(n_out, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    prev = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nxt_lo, nxt_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[nxt_lo:nxt_hi].mean(), y[nxt_lo:nxt_hi].mean()
+        area = np.abs(
+            (x[prev] - avg_x) * (y[lo:hi] - y[prev]) - (x[prev] - x[lo:hi]) * (avg_y - y[prev])
+        )
+        prev = lo + int(area.argmax())
+        kept[i + 1] = prev
+    return kept
+
+
+def downsample_rows(df: "pl.DataFrame", time_col: str, value_cols: list, max_points: int, method: str = "lttb"):
+    """Keep at most ~max_points rows per value column, chosen per series and unioned
+
+    Returned rows are original rows (no interpolated values), in time order.
+    "lttb" keeps the shape of each series; "minmax" keeps the minimum and
+    maximum of each of max_points // 2 equal-width time buckets, so spikes
+    always survive.
+    """
+    indexed = df.with_row_index("_row")
+    keep = set()
+    for col in value_cols:
+        series = indexed.select("_row", time_col, pl.col(col).cast(pl.Float64, strict=False)).drop_nulls()
+        if series.height <= max_points:
+            keep.update(series["_row"].to_list())
+            continue
+        if method == "lttb":
+            positions = lttb_indices(
+                series[time_col].cast(pl.Float64).to_numpy(), series[col].to_numpy(), max_points
+            )
+            keep.update(series["_row"].gather(positions).to_list())
+        else:
+            buckets = max(1, max_points // 2)
+            t = pl.col(time_col).cast(pl.Float64)
+            span = (t.max() - t.min()).clip(lower_bound=1e-9)
+            picked = (
+                series.with_columns(
+                    ((t - t.min()) / span * buckets).floor().clip(upper_bound=buckets - 1).alias("_bucket")
+                )
+                .group_by("_bucket")
+                .agg(
+                    pl.col("_row").get(pl.col(col).arg_min()).alias("_min_row"),
+                    pl.col("_row").get(pl.col(col).arg_max()).alias("_max_row"),
+                )
+            )
+            keep.update(picked["_min_row"].to_list())
+            keep.update(picked["_max_row"].to_list())
+    return indexed.filter(pl.col("_row").is_in(sorted(keep))).drop("_row")
+
+
+def _cast_like(values: "pl.Series", dtype) -> "pl.Series":
+    """String column parsed to dtype if every value fits, else to Float64, else left as text"""
+    for target in (dtype, pl.Float64):
+        try:
+            return values.cast(target)
+        except Exception:
+            pass
+    return values
+
+
+class RawSeriesStore:
+    """One patient's raw lab / vitals rows, at a cost proportional to that patient's rows
+
+    Reads from the partitioned Parquet layout (partition_eicu_data.py): one
+    part file, with row groups pruned by their id statistics. Only a table
+    that has never been partitioned is built on the request path (batched, so
+    memory stays bounded by a batch and a partition rather than the whole
+    CSV); a build failure is reported instead of loading the CSV.
+
+    Rows appended to the CSV since it was partitioned (``--incremental``) are
+    read from the file's tail, parsed once per append, and served alongside
+    the partitions. Once the tail passes ``max_tail_bytes``, or the CSV was
+    rewritten rather than appended to, the table is re-partitioned on a
+    background thread; the previous version (plus the tail) keeps serving
+    until the manifest switches.
+    """
+
+    def __init__(
+        self, data_dir: Path = DATA_DIR, partition_dir: Path = PARTITION_DIR, max_tail_bytes: int = 64 * 1024 * 1024
+    ):
+        self.data_dir = Path(data_dir)
+        self.partition_dir = Path(partition_dir)
+        self.max_tail_bytes = max_tail_bytes
+        self._partitions = None
+        self._manifest_mtime = None
+        self._tails = {}
+        self._rebuilding = set()
+        self._lock = threading.Lock()
+
+    def _dataset(self) -> Optional[PartitionedDataset]:
+        """The partitioned layout, re-read when its manifest is rewritten"""
+        try:
+            mtime = (self.partition_dir / "manifest.json").stat().st_mtime_ns
+        except OSError:
+            return None
+        if mtime != self._manifest_mtime:
+            self._partitions, self._manifest_mtime = PartitionedDataset.load(self.partition_dir), mtime
+        return self._partitions
+
+    def _partitions_for(self, table: str) -> PartitionedDataset:
+        """Partitioned layout holding table (possibly behind its CSV), building it on first use"""
+        partitions = self._dataset()
+        if partitions is not None and table in partitions.manifest["tables"]:
+            return partitions
+        with self._lock:
+            partitions = self._dataset()
+            if partitions is None or table not in partitions.manifest["tables"]:
+                print(f"Partitioning {table} for per-patient reads into {self.partition_dir}")
+                try:
+                    # skip_fresh: another worker may have built it while we waited for the lock
+                    partition_dataset(self.data_dir, self.partition_dir, DEFAULT_PARTITIONS, [table], skip_fresh=True)
+                except Exception as e:
+                    raise RuntimeError(
+                        f"no partitioned copy of {table} in {self.partition_dir} and building one "
+                        f"failed ({e}); run partition_eicu_data.py"
+                    ) from e
+                partitions = self._dataset()
+        if partitions is None or table not in partitions.manifest["tables"]:
+            raise RuntimeError(f"no partitioned copy of {table} in {self.partition_dir}; run partition_eicu_data.py")
+        return partitions
+
+    def _rebuild_in_background(self, table: str, num_partitions: int):
+        """Re-partition table on a daemon thread unless one is already running for it"""
+        with self._lock:
+            if table in self._rebuilding:
+                return
+            self._rebuilding.add(table)
+
+        def run():
+            try:
+                partition_dataset(self.data_dir, self.partition_dir, num_partitions, [table], skip_fresh=True)
+            except Exception as e:
+                print(f"Error re-partitioning {table}: {e}")
+            finally:
+                with self._lock:
+                    self._rebuilding.discard(table)
+
+        print(f"Re-partitioning {table} in the background")
+        threading.Thread(target=run, name=f"partition-{table}", daemon=True).start()
+
+    def _appended_rows(self, table: str, partitions: PartitionedDataset) -> Optional["pl.DataFrame"]:
+        """Rows appended to table's CSV since it was partitioned (None if there are none)
+
+        Growth past the partitioned size, with that size ending on a line
+        break, counts as an append; anything else is a rewrite, which starts
+        a background rebuild and serves the partitions as they are meanwhile.
+        """
+        if partitions.is_fresh(table, self.data_dir):
+            return None
+        entry = partitions.manifest["tables"][table]
+        path = self.data_dir / entry["source"]
+        stat = path.stat()
+        key = (table, entry["dir"], stat.st_size, stat.st_mtime_ns)
+        cached = self._tails.get(table)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        tail = None
+        with open(path, "rb") as f:
+            f.seek(max(entry["size"] - 1, 0))
+            appended = stat.st_size > entry["size"] and f.read(1) == b"\n"
+            if appended:
+                data = f.read(stat.st_size - entry["size"])
+                data = data[: data.rfind(b"\n") + 1]
+                if data:
+                    f.seek(0)
+                    header = f.readline()
+                    schema = partitions.scan(table).collect_schema()
+                    raw = pl.read_csv(header + data, infer_schema=False)
+                    tail = pl.DataFrame([_cast_like(raw[name], dtype) for name, dtype in schema.items()])
+        if not appended or stat.st_size - entry["size"] > self.max_tail_bytes:
+            self._rebuild_in_background(table, partitions.num_partitions(table))
+        self._tails[table] = (key, tail)
+        return tail
+
+    def patient_rows(self, table: str, patient_id: int) -> "pl.DataFrame":
+        """All raw rows for one patient in file order, with the table's time column present"""
+        if table not in RAW_SERIES_TIME_COLUMNS:
+            raise ValueError(f"Unknown table '{table}'")
+        partitions = self._partitions_for(table)
+        rows = partitions.scan_patient(table, patient_id).collect()
+        tail = self._appended_rows(table, partitions)
+        if tail is not None:
+            # Relaxed: an appended 150.7 widens an integer column, as whole-file inference would
+            rows = pl.concat([rows, tail.filter(pl.col("patientunitstayid") == patient_id)], how="vertical_relaxed")
+
+        time_col = RAW_SERIES_TIME_COLUMNS[table]
+        if time_col not in rows.columns:
+            # Same assumption as vitals_window_query: evenly spaced rows in file order
+            rows = rows.with_columns(
+                (pl.int_range(pl.len(), dtype=pl.Int64) * VITALS_CADENCE_MINUTES).alias(time_col)
+            )
+        return rows.sort(time_col, maintain_order=True)
+
+
+def create_server(
+    data_file,
+    hash_contents: bool = False,
+    watch_seconds: float = 0,
+    ingestor: Optional["IncrementalIngestor"] = None,
+    cache_pointer: Optional[Path] = None,
+):
+    """Build the MCP server over data_file, starting the reload watcher if requested
+
+    With cache_pointer (server workers) the server never runs the ETL: it
+    follows the cache file the parent publishes there (see watch_and_publish)
+    and reload_data asks the parent to rebuild.
+    """
+    if cache_pointer is not None:
+        server = PolarsMCPServerBuilder(
+            server_name="CompleteMedicalDataServerPolars",
+            csv_file_path=str(data_file),
+            stateless_http=True,
+            reload_source=functools.partial(read_cache_pointer, cache_pointer),
+            reload_request=request_parent_rebuild,
+            raw_series=RawSeriesStore(),
+        )
+        if server.df is not None:
+            server.start_reload_watcher(
+                functools.partial(read_cache_pointer, cache_pointer), watch_seconds or POINTER_POLL_SECONDS
+            )
+        return server
+
+    server = PolarsMCPServerBuilder(
+        server_name="CompleteMedicalDataServerPolars",
+        csv_file_path=str(data_file),
+        stateless_http=True,
+        ingestor=ingestor,
+        reload_source=functools.partial(load_cached_patient_data, hash_contents=hash_contents),
+        raw_series=RawSeriesStore(),
+    )
+    if server.df is not None and watch_seconds > 0:
+        # Appends to the tailed files are handled by the ingestor, not a full reload
+        tailed = (SOURCE_FILES["labs"], SOURCE_FILES["vitals"]) if ingestor else ()
+        server.start_reload_watcher(
+            functools.partial(source_fingerprint, DATA_DIR, hash_contents=hash_contents, exclude=tailed),
+            watch_seconds,
+        )
+        print(f"Watching {DATA_DIR} for changes every {watch_seconds}s")
+    return server
+
+
+def _run_worker(factory, sock):
+    """Worker process body: build the server, then serve the shared socket"""
+    import uvicorn
+
+    server = factory()
+    if server.df is None:
+        return
+    config = uvicorn.Config(
+        server.mcp.streamable_http_app(),
+        log_level=server.mcp.settings.log_level.lower(),
+    )
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def serve_workers(factory: Callable[[], Any], workers: int, host: str = "0.0.0.0", port: int = 8000):
+    """Serve the streamable-http app from several processes sharing one listening socket
+
+    Each worker calls ``factory`` (picklable, e.g. a functools.partial of
+    create_server) on the Arrow IPC cache. The cache is memory-mapped, so the
+    workers share the same page-cache pages instead of holding N copies; only
+    the small per-process indexes are duplicated. Workers are spawned rather
+    than forked because polars' thread pool does not survive fork. The
+    server must be stateless_http: any worker may receive any request.
+    """
+    import signal
+    import socket
+    import multiprocessing
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+
+    ctx = multiprocessing.get_context("spawn")
+    processes = [
+        ctx.Process(target=_run_worker, args=(factory, sock), name=f"mcp-worker-{i}")
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    print(f"Serving on {host}:{port} with {workers} workers (pids {', '.join(str(p.pid) for p in processes)})")
+
+    def forward(signum, frame):
+        # Ctrl+C already reaches the whole process group; SIGTERM only reaches us
+        if signum == signal.SIGTERM:
+            for process in processes:
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    for process in processes:
+        process.join()
+    sock.close()
+
+
+class FilterError(ValueError):
+    """Invalid filter request; str() is the message returned to the client"""
+
+
+class DataSnapshot:
+    """The served table plus everything derived from it, replaced as a whole on reload"""
+
+    def __init__(self, df=None, key_index=None, range_indexes=None, views=None, source=None, version=0):
+        self.df = df
+        self.key_index = key_index
+        self.range_indexes = range_indexes or {}
+        self.views = views or {}
+        self.source = source
+        self.version = version
+        self.loaded_at = time.time()
+
+    def replace(self, **changes) -> "DataSnapshot":
+        """Copy with some fields changed (same version and source unless given)"""
+        fields = dict(
+            df=self.df, key_index=self.key_index, range_indexes=self.range_indexes,
+            views=self.views, source=self.source, version=self.version,
+        )
+        fields.update(changes)
+        return DataSnapshot(**fields)
 
 
 class PolarsMCPServerBuilder(PolarsMCPServerBuilder):
-    """Fixed version of PolarsMCPServerBuilder with better type handling"""
-    
+    """Fixed version of PolarsMCPServerBuilder with better type handling
+
+    The table and its indexes live in one DataSnapshot. Reloads and
+    incremental updates build a new snapshot and swap it in with a single
+    assignment; every tool call pins the snapshot current when it started, so
+    in-flight requests finish against the data they began with.
+    """
+
+    def __init__(
+        self,
+        *args,
+        index_column: str = "patientunitstayid",
+        range_index_columns=("age", "lab_count", "heartrate_max", "actualiculos"),
+        outcome_columns=OUTCOME_COLUMNS,
+        ingestor: Optional[IncrementalIngestor] = None,
+        reload_source: Optional[Callable[[], Any]] = None,
+        reload_request: Optional[Callable[[], None]] = None,
+        raw_series: Optional[RawSeriesStore] = None,
+        **kwargs,
+    ):
+        self.index_column = index_column
+        self.range_index_columns = list(range_index_columns or [])
+        self.outcome_columns = list(outcome_columns or [])
+        self.ingestor = ingestor
+        self.raw_series = raw_series
+        # Returns the path to load on reload; defaults to re-reading csv_file_path
+        self.reload_source = reload_source
+        # Set for server workers: reload_data hands the rebuild to the parent
+        self.reload_request = reload_request
+        self._snapshot = DataSnapshot()
+        self._pinned = contextvars.ContextVar("pinned_snapshot", default=None)
+        self._ingest_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self.reload_status = {"reloading": False, "last_error": None}
+        super().__init__(*args, **kwargs)
+
+    @property
+    def snapshot(self) -> DataSnapshot:
+        """Snapshot pinned by the current request, else the latest one"""
+        return self._pinned.get() or self._snapshot
+
+    @property
+    def df(self):
+        return self.snapshot.df
+
+    @df.setter
+    def df(self, value):
+        self._snapshot = self._snapshot.replace(df=value)
+
+    @property
+    def key_index(self):
+        return self.snapshot.key_index
+
+    @property
+    def range_indexes(self):
+        return self.snapshot.range_indexes
+
+    @property
+    def views(self):
+        return self.snapshot.views
+
+    @contextlib.contextmanager
+    def _pin(self):
+        """Serve everything inside the block from one snapshot"""
+        token = self._pinned.set(self.snapshot)
+        try:
+            yield
+        finally:
+            self._pinned.reset(token)
+
+    def _pinned_call(self, func):
+        """Wrap a tool so a whole call sees a single snapshot"""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self._pin():
+                return func(*args, **kwargs)
+        return wrapper
+
+    def add_tool(self, func: callable) -> callable:
+        return super().add_tool(self._pinned_call(func))
+
+    def _load_dataframe(self):
+        """Load the data file and build the key and range indexes and views"""
+        self._snapshot = self._build_snapshot(self.csv_file_path)
+
+    def _build_snapshot(self, path, version: int = 1) -> DataSnapshot:
+        """Read a data file and derive the indexes and views, without touching the served data"""
+        df = self._read_dataframe(path)
+        if df is None:
+            return DataSnapshot(source=str(path), version=version)
+        return DataSnapshot(
+            df=df,
+            key_index=self._build_key_index(df),
+            range_indexes=self._build_range_indexes(df),
+            views=self._build_views(df),
+            source=str(path),
+            version=version,
+        )
+
+    def _read_dataframe(self, path):
+        """Read CSV, memory-map Arrow IPC and read Parquet directly; None on failure"""
+        suffix = Path(path).suffix
+        try:
+            if suffix == ".parquet":
+                df = pl.read_parquet(path, n_rows=self.initial_rows)
+            elif suffix in (".arrow", ".ipc", ".feather"):
+                # Uncompressed IPC files are memory-mapped by polars
+                df = pl.read_ipc(path, n_rows=self.initial_rows)
+            else:
+                df = pl.read_csv(path, n_rows=self.initial_rows)
+            print(f"Polars DataFrame loaded successfully from {path} with shape {df.shape}.")
+            return df
+        except Exception as e:
+            print(f"Error loading Polars DataFrame: {e}")
+            return None
+
+    def _build_key_index(self, df):
+        """Map each value of the index column to its row offsets"""
+        if self.index_column not in df.columns:
+            return None
+        offsets = (
+            df.select(self.index_column)
+            .with_row_index("_row")
+            .group_by(self.index_column)
+            .agg(pl.col("_row"))
+        )
+        key_index = dict(
+            zip(offsets[self.index_column].to_list(), offsets["_row"].to_list())
+        )
+        print(f"Indexed {len(key_index)} keys on '{self.index_column}'")
+        return key_index
+
+    def _build_range_indexes(self, df, columns=None, existing=None):
+        """Keep a sorted (value, row offset) permutation per range-indexed column
+
+        ``columns`` rebuilds only those indexes and copies the rest from ``existing``.
+        """
+        range_indexes = dict(existing or {}) if columns is not None else {}
+        for col in self.range_index_columns:
+            if columns is not None and col not in columns:
+                continue
+            if col not in df.columns or not df[col].dtype.is_numeric():
+                continue
+            ordered = (
+                df.select(col)
+                .with_row_index("_row")
+                .drop_nulls(col)
+                .sort(col)
+            )
+            range_indexes[col] = (ordered[col], ordered["_row"])
+        if range_indexes and columns is None:
+            print(f"Range indexes on: {', '.join(range_indexes)}")
+        return range_indexes
+
+    def _build_views(self, df):
+        """Column sets for the named views: features (no outcomes) and labels (id + outcomes)"""
+        views = {}
+        outcomes = [col for col in df.columns if col in self.outcome_columns]
+        views["features"] = [col for col in df.columns if col not in outcomes]
+        if outcomes:
+            id_cols = [self.index_column] if self.index_column in df.columns else []
+            views["labels"] = id_cols + outcomes
+        print(f"Views: {', '.join(f'{name} ({len(cols)} columns)' for name, cols in views.items())}")
+        return views
+
+    def reload(self) -> Dict[str, Any]:
+        """Rebuild the table from its source and swap it in; returns the new version info
+
+        The old snapshot keeps serving until the swap and stays alive until
+        the last request pinned to it returns. With incremental ingestion the
+        running state is rebuilt too, so appended rows are not counted twice.
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            raise RuntimeError("A reload is already running.")
+        self.reload_status["reloading"] = True
+        try:
+            path = self.reload_source() if self.reload_source else self.csv_file_path
+            if path is None:
+                raise RuntimeError("Reload source returned no data file.")
+            snapshot = self._build_snapshot(path, version=self._snapshot.version + 1)
+            if snapshot.df is None:
+                raise RuntimeError(f"Could not load {path}.")
+            with self._ingest_lock:
+                if self.ingestor is not None:
+                    snapshot = self._updated_snapshot(snapshot, self.ingestor.initialize())
+                self._snapshot = snapshot
+            self.csv_file_path = str(path)
+            self.reload_status["last_error"] = None
+            print(f"Reloaded {path}: version {snapshot.version}, shape {snapshot.df.shape}")
+            return self.data_version()
+        except Exception as e:
+            self.reload_status["last_error"] = str(e) or type(e).__name__
+            raise
+        finally:
+            self.reload_status["reloading"] = False
+            self._reload_lock.release()
+
+    def reload_in_background(self) -> bool:
+        """Start reload on a daemon thread; False if one is already running"""
+        if self.reload_status["reloading"]:
+            return False
+
+        def run():
+            try:
+                self.reload()
+            except Exception as e:
+                print(f"Error reloading data: {e}")
+
+        threading.Thread(target=run, name="data-reload", daemon=True).start()
+        return True
+
+    def start_reload_watcher(self, fingerprint: Callable[[], str], interval: float):
+        """Reload in the background whenever fingerprint() changes, checked every interval seconds"""
+        stop = threading.Event()
+
+        def run():
+            last = fingerprint()
+            while not stop.wait(interval):
+                try:
+                    current = fingerprint()
+                    if current != last and self.reload_in_background():
+                        print(f"Source data changed ({last} -> {current}), reloading")
+                        last = current
+                except Exception as e:
+                    print(f"Error watching source data: {e}")
+
+        threading.Thread(target=run, name="reload-watcher", daemon=True).start()
+        return stop
+
+    def data_version(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.version,
+            "source": snapshot.source,
+            "loaded_at": snapshot.loaded_at,
+            "rows": 0 if snapshot.df is None else snapshot.df.height,
+            **self.reload_status,
+        }
+
+    def _updated_snapshot(self, snapshot: DataSnapshot, updates: "pl.DataFrame"):
+        """Snapshot with the served columns of the patients in updates overwritten"""
+        rows, picks = [], []
+        for i, key in enumerate(updates[self.index_column].to_list()):
+            for row in snapshot.key_index.get(key, ()):
+                rows.append(row)
+                picks.append(i)
+        if not rows:
+            return snapshot
+        df = snapshot.df
+        updates = updates[picks]
+        changed = [
+            col for col in updates.columns
+            if col != self.index_column and col in df.columns
+        ]
+        replaced = []
+        for col in changed:
+            target, values = df[col], updates[col]
+            cast = values.cast(target.dtype, strict=False)
+            lossy = cast.null_count() > values.null_count()
+            if not lossy and target.dtype.is_integer() and values.dtype.is_float():
+                # A float into an integer column truncates (150.7 -> 150) without adding nulls
+                lossy = bool((cast.cast(values.dtype) != values).any())
+            if lossy:
+                # Value outside the planned dtype (e.g. a count past Int16, or 150.7): widen the column
+                if target.dtype.is_integer() and values.dtype.is_integer():
+                    # The smallest integer type for the updated range, as plan_dtypes picks on a full reload
+                    merged = target.cast(pl.Int64).scatter(rows, values.cast(pl.Int64))
+                    supertype = smallest_integer_dtype(merged.min(), merged.max()) or pl.Int64
+                else:
+                    supertype = pl.Float64 if values.dtype.is_float() else values.dtype
+                target, cast = target.cast(supertype), values.cast(supertype)
+            # clone() keeps readers of the previous frame unaffected by the scatter
+            replaced.append(target.clone().scatter(rows, cast))
+        df = df.with_columns(replaced)
+        return snapshot.replace(
+            df=df,
+            range_indexes=self._build_range_indexes(
+                df, [col for col in changed if col in snapshot.range_indexes], snapshot.range_indexes
+            ),
+        )
+
+    def apply_patient_updates(self, updates: "pl.DataFrame") -> int:
+        """Overwrite the served columns of the patients in updates; returns rows changed
+
+        Rows are located through the key index, so nothing is rejoined. The
+        updated snapshot is swapped in with one assignment. Patients that are
+        not in the served table yet are skipped until the next full load.
+        """
+        snapshot = self._snapshot
+        updated = self._updated_snapshot(snapshot, updates)
+        self._snapshot = updated
+        if updated is snapshot:
+            return 0
+        return sum(len(snapshot.key_index.get(key, ())) for key in updates[self.index_column].to_list())
+
+    def ingest_new_rows(self) -> Dict[str, int]:
+        """Fold rows appended to the lab and vitals files into the served table"""
+        if self.ingestor is None:
+            raise RuntimeError("Incremental ingestion is not enabled (start with --incremental).")
+        with self._ingest_lock:
+            updates, summary = self.ingestor.poll()
+            summary["rows_updated"] = 0 if updates is None else self.apply_patient_updates(updates)
+        if summary["rows_updated"]:
+            print(f"Ingested {summary}")
+        return summary
+
+    def start_ingest_polling(self, interval: float):
+        """Call ingest_new_rows every interval seconds on a daemon thread"""
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                try:
+                    self.ingest_new_rows()
+                except Exception as e:
+                    print(f"Error ingesting new rows: {e}")
+
+        threading.Thread(target=run, name="ingest-poller", daemon=True).start()
+        return stop
+
+    def _index_lookup(self, column: str, operator: str, value):
+        """Gather rows using an index when one covers the predicate; None otherwise"""
+        if operator in ('==', 'in') and column == self.index_column and self.key_index is not None:
+            keys = value if operator == 'in' else [value]
+            if self.df[column].dtype.is_integer():
+                keys = [int(k) for k in keys]
+            rows = sorted(
+                row for key in dict.fromkeys(keys) for row in self.key_index.get(key, ())
+            )
+            return self.df[rows]
+
+        if operator in ('>', '>=', '<', '<=') and column in self.range_indexes:
+            values, offsets = self.range_indexes[column]
+            if operator == '>':
+                start, end = values.search_sorted(value, side="right"), len(values)
+            elif operator == '>=':
+                start, end = values.search_sorted(value, side="left"), len(values)
+            elif operator == '<':
+                start, end = 0, values.search_sorted(value, side="left")
+            else:
+                start, end = 0, values.search_sorted(value, side="right")
+            return self.df[offsets[start:end].sort().to_list()]
+
+        return None
+
+    def _get_df_schema(self):
+        """Column types, annotated with the index that covers each column"""
+        schema = super()._get_df_schema()
+        if self.key_index is not None:
+            schema[self.index_column] += " [hash index]"
+        for col in self.range_indexes:
+            schema[col] += " [sorted index]"
+        return schema
+
+    def _add_common_tools(self):
+        """Register the DataFrame tools, with pagination on get_head/filter_rows"""
+
+        @self.mcp.tool()
+        @self._pinned_call
+        def get_head(
+            n: int = 5,
+            limit: Optional[int] = None,
+            cursor: Optional[str] = None,
+            columns: Optional[List[str]] = None,
+            exclude_columns: Optional[List[str]] = None,
+            format: str = "json",
+            view: Optional[str] = None,
+        ) -> str:
+            """
+            Returns the first n rows as JSON.
+            columns / exclude_columns restrict which columns are returned;
+            view="features" leaves out the outcome columns, view="labels" keeps only them.
+            format="arrow" returns an "arrow-ipc;base64," prefixed Arrow IPC stream instead.
+            Pass limit (page size) and then the returned next_cursor to page
+            through them; paged responses are {"rows", "next_cursor", "total_rows"}.
+            """
+            if self.df is None:
+                return "Error: DataFrame not loaded."
+            try:
+                return self._rows_response(
+                    self.df.head(n), limit, cursor, columns, exclude_columns,
+                    ["get_head", n, view], format, view,
+                )
+            except Exception as e:
+                return f"Error reading rows: {str(e)}"
+        self.tools.append(get_head.__name__)
+
+        @self.mcp.tool()
+        @self._pinned_call
+        def get_schema() -> Dict[str, str]:
+            """Returns column names and types."""
+            if self.df is None:
+                return {"error": "DataFrame not loaded."}
+            return self._get_df_schema()
+        self.tools.append(get_schema.__name__)
+
+        @self.mcp.tool()
+        @self._pinned_call
+        def get_shape() -> Dict[str, int]:
+            """Returns row and column counts."""
+            if self.df is None:
+                return {"error": "DataFrame not loaded."}
+            rows, cols = self._get_df_shape()
+            return {"rows": rows, "columns": cols}
+        self.tools.append(get_shape.__name__)
+
+        @self.mcp.tool()
+        @self._pinned_call
+        def select_columns(columns: List[str]) -> str:
+            """Returns specific columns as JSON."""
+            if self.df is None:
+                return "Error: DataFrame not loaded."
+            try:
+                return self._select_df_columns(columns)
+            except Exception as e:
+                return f"Error selecting columns: {str(e)}"
+        self.tools.append(select_columns.__name__)
+
+        @self.mcp.tool()
+        @self._pinned_call
+        def filter_rows(
+            column: str,
+            operator: str,
+            value: Any,
+            limit: Optional[int] = None,
+            cursor: Optional[str] = None,
+            columns: Optional[List[str]] = None,
+            exclude_columns: Optional[List[str]] = None,
+            format: str = "json",
+            view: Optional[str] = None,
+        ) -> str:
+            """
+            Filters rows by condition and returns as JSON.
+            Operators: ==, !=, >, <, >=, <=, contains, in
+            columns / exclude_columns restrict which columns are returned;
+            view="features" leaves out the outcome columns, view="labels" keeps only them.
+            format="arrow" returns an "arrow-ipc;base64," prefixed Arrow IPC stream instead.
+            Pass limit (page size) and then the returned next_cursor to page
+            through large results; paged responses are
+            {"rows", "next_cursor", "total_rows"}.
+            """
+            if self.df is None:
+                return "Error: DataFrame not loaded."
+            try:
+                return self._rows_response(
+                    self._filter_df(column, operator, value),
+                    limit, cursor, columns, exclude_columns,
+                    ["filter_rows", column, operator, value, view], format, view,
+                )
+            except Exception as e:
+                return f"Error filtering rows: {str(e)}"
+        self.tools.append(filter_rows.__name__)
+
+        @self.mcp.tool()
+        @self._pinned_call
+        def filter_where(
+            where: Dict[str, Any],
+            limit: Optional[int] = None,
+            cursor: Optional[str] = None,
+            columns: Optional[List[str]] = None,
+            exclude_columns: Optional[List[str]] = None,
+            format: str = "json",
+            view: Optional[str] = None,
+        ) -> str:
+            """
+            Filters rows with a boolean tree of predicates in one pass.
+            Leaf: {"column": ..., "operator": ..., "value": ...} (filter_rows operators).
+            Combine with {"and": [...]}, {"or": [...]} and {"not": {...}}, e.g.
+            {"and": [{"column": "age", "operator": ">", "value": 65},
+                     {"column": "has_lactate", "operator": "==", "value": true}]}
+            Supports the same limit/cursor/columns/exclude_columns/format/view as filter_rows.
+            """
+            if self.df is None:
+                return "Error: DataFrame not loaded."
+            try:
+                return self._rows_response(
+                    self._filter_where(where),
+                    limit, cursor, columns, exclude_columns,
+                    ["filter_where", where, view], format, view,
+                )
+            except Exception as e:
+                return f"Error filtering rows: {str(e)}"
+        self.tools.append(filter_where.__name__)
+
+        @self.mcp.tool()
+        @self._pinned_call
+        def aggregate(
+            metrics: List[Dict[str, Any]],
+            group_by: Optional[List[str]] = None,
+            where: Optional[Dict[str, Any]] = None,
+        ) -> str:
+            """
+            Computes summary statistics on the server and returns only the result as JSON.
+            Each metric is {"column": ..., "op": ...} with op one of count, n_distinct,
+            distinct (list of values), mean, median, min, max, sum, quantile (add "q": 0-1).
+            Optional "alias" names the output. group_by lists columns to group on;
+            where is a filter_where tree applied first.
+            Example: metrics=[{"column": "patientunitstayid", "op": "distinct"}]
+            """
+            if self.df is None:
+                return "Error: DataFrame not loaded."
+            try:
+                return self._aggregate(metrics, group_by, where)
+            except Exception as e:
+                return f"Error aggregating rows: {str(e)}"
+        self.tools.append(aggregate.__name__)
+
+        self._add_stream_routes()
+
+        def get_rows_by_ids(
+            ids: List[Any],
+            column: str = "patientunitstayid",
+            columns: Optional[List[str]] = None,
+            exclude_columns: Optional[List[str]] = None,
+            view: Optional[str] = None,
+            format: str = "json",
+        ) -> str:
+            """
+            Returns the rows for many ids in one call as JSON {"<id>": [rows]}.
+            Ids without rows map to an empty list.
+            columns / exclude_columns / view restrict which columns are returned.
+            format="arrow" returns all matching rows as one base64 Arrow IPC stream
+            instead (the id column is always included so clients can split it);
+            it is smaller than JSON from about ten rows on.
+            """
+            if self.df is None:
+                return "Error: DataFrame not loaded."
+            try:
+                return self._rows_by_ids(ids, column, columns, exclude_columns, view, format)
+            except Exception as e:
+                return f"Error fetching rows: {str(e)}"
+        self.add_tool(get_rows_by_ids)
+
+        def filter_rows_batch(filters: List[Dict[str, Any]]) -> str:
+            """
+            Runs many filters in one call. Each filter is
+            {"column": ..., "operator": ..., "value": ...}.
+            Returns a JSON list, in input order, of {"filter": ..., "rows": [...]}
+            or {"filter": ..., "error": "..."}.
+            """
+            if self.df is None:
+                return "Error: DataFrame not loaded."
+            try:
+                return self._filter_batch(filters)
+            except Exception as e:
+                return f"Error filtering rows: {str(e)}"
+        self.add_tool(filter_rows_batch)
+
+        def get_labels(ids: Optional[List[Any]] = None) -> str:
+            """
+            Returns the "labels" view (id plus outcome columns) as compact JSON rows,
+            for all patients or only the given ids. Meant for evaluation; prediction
+            requests should use view="features".
+            """
+            if self.df is None:
+                return "Error: DataFrame not loaded."
+            if "labels" not in self.views:
+                return "Error: No outcome columns in the loaded data."
+            try:
+                df = self.df if ids is None else self._filter_df(self.index_column, 'in', ids)
+                df = self._project(df, view="labels")
+                if isinstance(df, str):
+                    return df
+                return json.dumps(self._records(df), separators=(",", ":"))
+            except Exception as e:
+                return f"Error fetching labels: {str(e)}"
+        self.add_tool(get_labels)
+
+        def get_views() -> Dict[str, List[str]]:
+            """Returns the named views and their columns."""
+            return self.views
+        self.add_tool(get_views)
+
+        def reload_data() -> str:
+            """
+            Admin: rebuilds the table from its source in the background and swaps it
+            in atomically; requests already running finish on the old data.
+            With several workers the parent process rebuilds once and every worker
+            switches to the new table. Check progress with data_version.
+            """
+            if self.reload_request is not None:
+                self.reload_request()
+                return json.dumps({"requested": True, **self.data_version()})
+            started = self.reload_in_background()
+            return json.dumps({"started": started, **self.data_version()})
+        self.add_tool(reload_data)
+
+        def data_version() -> str:
+            """Returns the served data version, its source file, row count and reload state."""
+            return json.dumps(self.data_version())
+        self.add_tool(data_version)
+
+        if self.ingestor is not None:
+            def ingest_new_rows() -> str:
+                """
+                Admin: reads rows appended to lab.csv / vitalPeriodic.csv since the
+                last pass and updates only the affected patients. Returns row counts.
+                """
+                if self.df is None:
+                    return "Error: DataFrame not loaded."
+                try:
+                    return json.dumps(self.ingest_new_rows())
+                except Exception as e:
+                    return f"Error ingesting new rows: {str(e)}"
+            self.add_tool(ingest_new_rows)
+
+        if self.raw_series is not None:
+            def get_patient_vitals(
+                patient_id: int,
+                columns: Optional[List[str]] = None,
+                max_points: Optional[int] = None,
+                method: str = "lttb",
+                format: str = "json",
+            ) -> str:
+                """
+                Returns one patient's raw vitalPeriodic rows in time order, with
+                observationoffset in minutes (derived from a 5-minute cadence when the
+                file has no offset). columns picks the vital signs (default all).
+                max_points downsamples each vital to about that many points: "lttb"
+                keeps the shape of the curve, "minmax" keeps each time bucket's lowest
+                and highest reading. Only original rows are returned.
+                JSON {"rows": [...], "total_rows": n, "returned": k, ...}.
+                """
+                try:
+                    return self._raw_series_response("vitals", patient_id, columns, None, max_points, method, format)
+                except Exception as e:
+                    return f"Error fetching vitals: {str(e)}"
+            self.add_tool(get_patient_vitals)
+
+            def get_patient_labs(
+                patient_id: int,
+                labnames: Optional[List[str]] = None,
+                max_points: Optional[int] = None,
+                method: str = "lttb",
+                format: str = "json",
+            ) -> str:
+                """
+                Returns one patient's raw lab rows (labname, labresultoffset in minutes,
+                labresult) in time order, optionally only the given labnames.
+                max_points downsamples each lab's series the same way as
+                get_patient_vitals. JSON {"rows": [...], "total_rows": n, ...}.
+                """
+                try:
+                    return self._raw_series_response("labs", patient_id, None, labnames, max_points, method, format)
+                except Exception as e:
+                    return f"Error fetching labs: {str(e)}"
+            self.add_tool(get_patient_labs)
+
+    AGGREGATE_OPS = (
+        "count", "n_distinct", "distinct", "mean", "median", "min", "max", "sum", "quantile",
+    )
+
+    def _aggregate(self, metrics, group_by=None, where=None) -> str:
+        """Evaluate the requested metrics, optionally filtered and grouped"""
+        if not isinstance(metrics, list) or not metrics:
+            return "Error: metrics must be a non-empty list."
+        group_by = list(group_by or [])
+        missing_cols = [col for col in group_by if col not in self.df.columns]
+        if missing_cols:
+            return f"Error: The following columns were not found in the DataFrame: {', '.join(missing_cols)}"
+
+        exprs = []
+        for metric in metrics:
+            if not isinstance(metric, dict):
+                return "Error: Each metric must be an object with 'column' and 'op'."
+            column, op = metric.get("column", "*"), metric.get("op")
+            if op not in self.AGGREGATE_OPS:
+                return f"Error: Unsupported op '{op}'. Supported ops are {', '.join(self.AGGREGATE_OPS)}."
+            if column == "*":
+                if op != "count":
+                    return "Error: Column '*' only supports the 'count' op."
+                exprs.append(pl.len().alias(metric.get("alias", "count")))
+                continue
+            if column not in self.df.columns:
+                return f"Error: Column '{column}' not found."
+
+            col_expr = pl.col(column)
+            if op in ("mean", "sum") and self.df.schema[column] == pl.Float32:
+                # Accumulate the stored decimals in float64, as before compaction
+                col_expr = col_expr.cast(pl.String).cast(pl.Float64)
+            if op == "quantile":
+                q = metric.get("q")
+                if not isinstance(q, (int, float)) or not 0 <= q <= 1:
+                    return "Error: 'quantile' needs a numeric 'q' between 0 and 1."
+                expr, name = col_expr.quantile(q), f"{column}_q{q:g}"
+            elif op == "distinct":
+                expr, name = col_expr.drop_nulls().unique(maintain_order=True), f"{column}_distinct"
+            else:
+                expr, name = getattr(col_expr, op)(), f"{column}_{op}"
+            exprs.append(expr.alias(metric.get("alias", name)))
+
+        df = self.df
+        if where is not None:
+            df = self._filter_where(where)
+            if isinstance(df, str):
+                return df
+
+        if group_by:
+            result = df.group_by(group_by, maintain_order=True).agg(exprs).sort(group_by)
+        else:
+            # Distinct lists have their own length; wrap scalars alongside them
+            result = df.select(
+                expr.implode() if metric.get("op") == "distinct" else expr
+                for expr, metric in zip(exprs, metrics)
+            )
+        return json.dumps(self._records(result), indent=2, default=str)
+
+    def _rows_response(
+        self, df, limit, cursor, columns, exclude_columns, query: list, format: str = "json", view=None
+    ) -> str:
+        """Project, then serialise either the whole frame or one page of it"""
+        if isinstance(df, str):
+            return df
+        if format not in ("json", "arrow"):
+            return f"Error: Unsupported format '{format}'. Use 'json' or 'arrow'."
+        df = self._project(df, columns, exclude_columns, view)
+        if isinstance(df, str):
+            return df
+        if limit is None and cursor is None:
+            if format == "arrow":
+                return self._df_to_arrow(df)
+            result_json = self._df_to_json(df)
+            print(f"DEBUG: JSON result length: {len(result_json)}")
+            return result_json
+        return self._paged_json(df, limit, cursor, query, format)
+
+    def _raw_series_response(
+        self, table: str, patient_id, columns=None, labnames=None, max_points=None, method="lttb", format="json"
+    ) -> str:
+        """Serialise one patient's raw rows from self.raw_series, downsampled per series if asked"""
+        if format not in ("json", "arrow"):
+            return f"Error: Unsupported format '{format}'. Use 'json' or 'arrow'."
+        if method not in DOWNSAMPLE_METHODS:
+            return f"Error: Unsupported method '{method}'. Use {' or '.join(repr(m) for m in DOWNSAMPLE_METHODS)}."
+        if max_points is not None and (not isinstance(max_points, int) or max_points < 3):
+            return "Error: max_points must be an integer of at least 3."
+
+        rows = self.raw_series.patient_rows(table, int(patient_id))
+        time_col = RAW_SERIES_TIME_COLUMNS[table]
+        key_cols = ["patientunitstayid", time_col]
+        if table == "vitals":
+            available = [col for col in rows.columns if col not in key_cols]
+            if columns:
+                missing_cols = [col for col in columns if col not in available]
+                if missing_cols:
+                    return f"Error: The following columns were not found in the DataFrame: {', '.join(missing_cols)}"
+                available = list(columns)
+            rows = rows.select(
+                *key_cols,
+                *[
+                    pl.col(col) if rows.schema[col].is_numeric() else pl.col(col).cast(pl.Float64, strict=False)
+                    for col in available
+                ],
+            )
+            total_rows = rows.height
+            if max_points is not None:
+                rows = downsample_rows(rows, time_col, available, max_points, method)
+        else:
+            if labnames:
+                rows = rows.filter(pl.col("labname").is_in(list(labnames)))
+            total_rows = rows.height
+            if max_points is not None and rows.height:
+                rows = pl.concat(
+                    downsample_rows(series, time_col, ["labresult"], max_points, method)
+                    for series in rows.partition_by("labname", maintain_order=True)
+                ).sort(time_col, maintain_order=True)
+
+        payload = self._df_to_arrow(rows) if format == "arrow" else self._records(rows)
+        return json.dumps(
+            {
+                "patientunitstayid": int(patient_id),
+                "time_column": time_col,
+                "total_rows": total_rows,
+                "returned": rows.height,
+                "downsampled": method if max_points is not None and rows.height < total_rows else None,
+                "rows": payload,
+            },
+            separators=(",", ":"),
+        )
+
+    @staticmethod
+    def _records(df: "pl.DataFrame") -> List[Dict[str, Any]]:
+        """Rows as dicts, with Float32 values at their shortest decimal form
+
+        Going through the string form keeps a stored 72.29 as 72.29 in JSON
+        instead of the widened 72.29000091552734.
+        """
+        return df.with_columns(pl.col(pl.Float32).cast(pl.String).cast(pl.Float64)).to_dicts()
+
+    def _df_to_json(self, df_subset: "pl.DataFrame") -> str:
+        return json.dumps(self._records(df_subset), indent=2)
+
+    @staticmethod
+    def _df_to_arrow(df: "pl.DataFrame") -> str:
+        """Arrow IPC stream as text: ARROW_IPC_PREFIX followed by base64"""
+        payload = df.write_ipc_stream(None, compression="uncompressed").getvalue()
+        return ARROW_IPC_PREFIX + base64.b64encode(payload).decode("ascii")
+
+    def _project(
+        self,
+        df: "pl.DataFrame",
+        columns: Optional[List[str]] = None,
+        exclude_columns: Optional[List[str]] = None,
+        view: Optional[str] = None,
+    ):
+        """Keep only the requested columns before serialisation; error string if unknown"""
+        if isinstance(df, str):
+            return df
+        if view is not None:
+            if view not in self.views:
+                return f"Error: Unknown view '{view}'. Available views: {', '.join(self.views)}"
+            df = df.select(self.views[view])
+        requested = list(columns or []) + list(exclude_columns or [])
+        missing_cols = [col for col in requested if col not in df.columns]
+        if missing_cols:
+            return f"Error: The following columns were not found in the DataFrame: {', '.join(missing_cols)}"
+        if columns:
+            df = df.select(columns)
+        if exclude_columns:
+            df = df.drop(exclude_columns)
+        return df
+
+    @staticmethod
+    def _query_key(query: list) -> str:
+        """Short digest tying a cursor to the query that produced it"""
+        return hashlib.sha256(json.dumps(query, default=str).encode()).hexdigest()[:12]
+
+    def _paged_json(
+        self, df: "pl.DataFrame", limit: Optional[int], cursor: Optional[str], query: list, format: str = "json"
+    ) -> str:
+        """Serialise one page of df; only the page is ever turned into JSON"""
+        offset = 0
+        if cursor:
+            try:
+                state = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+                offset, cursor_key, limit = state["offset"], state["query"], limit or state["limit"]
+            except Exception:
+                return "Error: Invalid cursor."
+            if cursor_key != self._query_key(query):
+                return "Error: Cursor does not belong to this query."
+        if not limit or limit < 1:
+            return "Error: limit must be a positive integer."
+
+        page = df.slice(offset, limit)
+        next_offset = offset + page.height
+        next_cursor = None
+        if next_offset < df.height:
+            state = {"offset": next_offset, "limit": limit, "query": self._query_key(query)}
+            next_cursor = base64.urlsafe_b64encode(json.dumps(state).encode()).decode()
+        rows = self._df_to_arrow(page) if format == "arrow" else self._records(page)
+        return json.dumps(
+            {"rows": rows, "next_cursor": next_cursor, "total_rows": df.height},
+            indent=2,
+        )
+
+    def _frame_from_query(self, params):
+        """Resolve HTTP query parameters to a filtered, projected frame or an error string"""
+        df = self.df
+        if df is None:
+            return "Error: DataFrame not loaded."
+        if "where" in params:
+            try:
+                where = json.loads(params["where"])
+            except ValueError:
+                return "Error: where must be JSON."
+            df = self._filter_where(where)
+        elif "column" in params:
+            value = params.get("value")
+            try:
+                value = json.loads(value)
+            except (TypeError, ValueError):
+                pass
+            df = self._filter_df(params["column"], params.get("operator", "=="), value)
+        if isinstance(df, str):
+            return df
+        return self._project(
+            df,
+            [c for c in params.get("columns", "").split(",") if c],
+            [c for c in params.get("exclude_columns", "").split(",") if c],
+            params.get("view"),
+        )
+
+    def _add_stream_routes(self):
+        """Expose GET /rows.ndjson and /rows.arrow that stream filter results in row batches
+
+        Query parameters: column, operator, value (JSON-decoded when possible)
+        or where (a JSON filter_where tree), columns / exclude_columns
+        (comma-separated), view and batch_size. Without a filter the whole table is
+        streamed. /rows.arrow sends one Arrow IPC stream, readable with
+        pl.read_ipc_stream or pyarrow.ipc.open_stream. Only available on the
+        HTTP transports.
+        """
+        from starlette.responses import PlainTextResponse, StreamingResponse
+
+        def resolve(request):
+            params = request.query_params
+            df = self._frame_from_query(params)
+            if isinstance(df, str):
+                status = 503 if self.df is None else 400
+                return None, None, PlainTextResponse(df, status_code=status)
+            try:
+                batch_size = max(1, int(params.get("batch_size", 1000)))
+            except ValueError:
+                return None, None, PlainTextResponse("Error: batch_size must be an integer.", status_code=400)
+            return df, batch_size, None
+
+        @self.mcp.custom_route("/rows.ndjson", methods=["GET"])
+        async def stream_rows(request):
+            df, batch_size, error = resolve(request)
+            if error is not None:
+                return error
+
+            def batches():
+                for batch in df.iter_slices(batch_size):
+                    yield batch.write_ndjson()
+
+            return StreamingResponse(batches(), media_type="application/x-ndjson")
+
+        @self.mcp.custom_route("/rows.arrow", methods=["GET"])
+        async def stream_rows_arrow(request):
+            df, batch_size, error = resolve(request)
+            if error is not None:
+                return error
+
+            def batches():
+                import io
+                import pyarrow as pa
+
+                table = df.to_arrow()
+                sink = io.BytesIO()
+                with pa.ipc.new_stream(sink, table.schema) as writer:
+                    for batch in table.to_batches(max_chunksize=batch_size):
+                        writer.write_batch(batch)
+                        yield sink.getvalue()
+                        sink.seek(0)
+                        sink.truncate()
+                yield sink.getvalue()
+
+            return StreamingResponse(batches(), media_type="application/vnd.apache.arrow.stream")
+
+    def _rows_by_ids(
+        self,
+        ids: List[Any],
+        column: str,
+        columns: Optional[List[str]] = None,
+        exclude_columns: Optional[List[str]] = None,
+        view: Optional[str] = None,
+        format: str = "json",
+    ) -> str:
+        """Fetch all ids with a single (indexed) 'in' lookup and group by id"""
+        if not isinstance(ids, list):
+            return "Error: ids must be a list."
+        if format not in ("json", "arrow"):
+            return f"Error: Unsupported format '{format}'. Use 'json' or 'arrow'."
+        filtered_df = self._filter_df(column, 'in', ids)
+        if isinstance(filtered_df, str):
+            return filtered_df
+        key_series = filtered_df[column]
+        keys = key_series.cast(pl.Utf8).to_list()
+        filtered_df = self._project(filtered_df, columns, exclude_columns, view)
+        if isinstance(filtered_df, str):
+            return filtered_df
+        if format == "arrow":
+            if column not in filtered_df.columns:
+                filtered_df = filtered_df.insert_column(0, key_series)
+            return self._df_to_arrow(filtered_df)
+
+        grouped = {str(key): [] for key in ids}
+        for key, row in zip(keys, self._records(filtered_df)):
+            grouped.setdefault(key, []).append(row)
+        return json.dumps(grouped, indent=2)
+
+    def _filter_batch(self, filters: List[Dict[str, Any]]) -> str:
+        """Run each filter spec and collect rows or errors in input order"""
+        if not isinstance(filters, list):
+            return "Error: filters must be a list."
+        results = []
+        for spec in filters:
+            try:
+                filtered_df = self._filter_df(spec["column"], spec["operator"], spec.get("value"))
+            except (KeyError, TypeError):
+                filtered_df = "Error: each filter needs 'column', 'operator' and 'value'."
+            if isinstance(filtered_df, str):
+                results.append({"filter": spec, "error": filtered_df})
+            else:
+                results.append({"filter": spec, "rows": self._records(filtered_df)})
+        return json.dumps(results, indent=2)
+
     def _filter_df_rows(self, column: str, operator: str, value) -> str:
         """Fixed version with better type conversion and debugging"""
+        filtered_df = self._filter_df(column, operator, value)
+        if isinstance(filtered_df, str):
+            return filtered_df
+
+        result_json = self._df_to_json(filtered_df)
+        print(f"DEBUG: JSON result length: {len(result_json)}")
+
+        return result_json
+
+    def _filter_df(self, column: str, operator: str, value):
+        """Apply one filter and return the matching frame, or an error string"""
         if self.df is None: 
             return "Error: DataFrame not loaded."
         if column not in self.df.columns:
@@ -136,14 +2164,82 @@ class PolarsMCPServerBuilder(PolarsMCPServerBuilder):
 
         print(f"DEBUG: Filtering column '{column}' with operator '{operator}' and value '{value}' (type: {type(value)})")
         
-        # Convert value to correct type for comparison
+        value = self._coerce_filter_value(column, operator, value)
+        if isinstance(value, FilterError):
+            return str(value)
+
+        try:
+            filtered_df = self._index_lookup(column, operator, value)
+            if filtered_df is not None:
+                print(f"DEBUG: Index lookup produced {filtered_df.height} rows")
+            else:
+                condition = self._build_condition(column, operator, value)
+                if isinstance(condition, FilterError):
+                    return str(condition)
+                filtered_df = self.df.filter(condition)
+                print(f"DEBUG: Filter produced {filtered_df.height} rows")
+
+            return filtered_df
+
+        except Exception as e:
+            error_msg = f"Error applying filter: {str(e)}"
+            print(f"DEBUG: {error_msg}")
+            return error_msg
+
+    def _filter_where(self, where: Dict[str, Any]):
+        """Apply an AND/OR/NOT predicate tree in one pass; frame or error string"""
+        if self.df is None:
+            return "Error: DataFrame not loaded."
+        try:
+            condition = self._compile_where(where)
+        except FilterError as e:
+            return str(e)
+        try:
+            filtered_df = self.df.filter(condition)
+            print(f"DEBUG: Compound filter produced {filtered_df.height} rows")
+            return filtered_df
+        except Exception as e:
+            return f"Error applying filter: {str(e)}"
+
+    def _compile_where(self, node) -> "pl.Expr":
+        """Compile {"and": [...]}, {"or": [...]}, {"not": {...}} and leaf predicates"""
+        if not isinstance(node, dict):
+            raise FilterError("Error: Each filter node must be an object.")
+        for op in ("and", "or"):
+            if op in node:
+                children = node[op]
+                if not isinstance(children, list) or not children:
+                    raise FilterError(f"Error: '{op}' requires a non-empty list.")
+                exprs = [self._compile_where(child) for child in children]
+                return pl.all_horizontal(exprs) if op == "and" else pl.any_horizontal(exprs)
+        if "not" in node:
+            return ~self._compile_where(node["not"])
+        if "column" not in node or "operator" not in node:
+            raise FilterError(
+                "Error: A predicate needs 'column', 'operator' and 'value' "
+                "(or use 'and' / 'or' / 'not')."
+            )
+
+        column, operator = node["column"], node["operator"]
+        if column not in self.df.columns:
+            raise FilterError(f"Error: Column '{column}' not found.")
+        value = self._coerce_filter_value(column, operator, node.get("value"))
+        if isinstance(value, FilterError):
+            raise value
+        condition = self._build_condition(column, operator, value)
+        if isinstance(condition, FilterError):
+            raise condition
+        return condition
+
+    def _coerce_filter_value(self, column: str, operator: str, value):
+        """Convert value to the column's type; FilterError when it cannot be"""
         try:
             col_dtype = self.df[column].dtype
             print(f"DEBUG: Column '{column}' has dtype: {col_dtype}")
             
             if operator == 'in':
                 if not isinstance(value, list):
-                    return "Error: For 'in' operator, value must be a list."
+                    return FilterError("Error: For 'in' operator, value must be a list.")
             elif col_dtype.is_integer():
                 # Ensure we convert to the right integer type
                 if isinstance(value, str):
@@ -162,91 +2258,127 @@ class PolarsMCPServerBuilder(PolarsMCPServerBuilder):
                 else:
                     value = bool(value)
                 print(f"DEBUG: Converted value to bool: {value}")
-            elif col_dtype == pl.Utf8 and not isinstance(value, str):
+            elif (col_dtype == pl.Utf8 or isinstance(col_dtype, (pl.Enum, pl.Categorical))) and not isinstance(value, str):
                 value = str(value)
                 print(f"DEBUG: Converted value to str: {value}")
 
         except Exception as e:
             error_msg = f"Error converting value for filtering: {str(e)}. Column '{column}' type is {col_dtype}."
             print(f"DEBUG: {error_msg}")
-            return error_msg
+            return FilterError(error_msg)
 
-        # Apply the filter
+        return value
+
+    def _build_condition(self, column: str, operator: str, value):
+        """Polars expression for one predicate; FilterError for bad operators"""
         col_expr = pl.col(column)
-        
-        try:
-            if operator == '==':
-                condition = col_expr == value
-            elif operator == '!=':
-                condition = col_expr != value
-            elif operator == '>':
-                condition = col_expr > value
-            elif operator == '<':
-                condition = col_expr < value
-            elif operator == '>=':
-                condition = col_expr >= value
-            elif operator == '<=':
-                condition = col_expr <= value
-            elif operator == 'contains':
-                if not isinstance(value, str):
-                    return "Error: 'contains' operator requires a string value."
-                if self.df[column].dtype != pl.Utf8:
-                     condition = col_expr.cast(pl.Utf8).str.contains(value, literal=False)
-                else:
-                     condition = col_expr.str.contains(value, literal=False)
-            elif operator == 'in':
-                if not isinstance(value, list):
-                     return "Error: 'in' operator requires a list value."
-                condition = col_expr.is_in(value)
-            else:
-                return f"Error: Unsupported operator '{operator}'. Supported operators are '==', '!=', '>', '<', '>=', '<=', 'contains', 'in'."
-            
-            filtered_df = self.df.filter(condition)
-            print(f"DEBUG: Filter produced {filtered_df.height} rows")
-            
-            result_json = self._df_to_json(filtered_df)
-            print(f"DEBUG: JSON result length: {len(result_json)}")
-            
-            return result_json
-            
-        except Exception as e:
-            error_msg = f"Error applying filter: {str(e)}"
-            print(f"DEBUG: {error_msg}")
-            return error_msg
+        if operator in ('>', '<', '>=', '<=', 'in') and isinstance(self.df[column].dtype, (pl.Enum, pl.Categorical)):
+            # Compacted string columns: compare as text, as before compact_dtypes
+            # (an Enum only accepts its own categories as comparison values)
+            col_expr = col_expr.cast(pl.Utf8)
 
+        if operator == '==':
+            return col_expr == value
+        elif operator == '!=':
+            return col_expr != value
+        elif operator == '>':
+            return col_expr > value
+        elif operator == '<':
+            return col_expr < value
+        elif operator == '>=':
+            return col_expr >= value
+        elif operator == '<=':
+            return col_expr <= value
+        elif operator == 'contains':
+            if not isinstance(value, str):
+                return FilterError("Error: 'contains' operator requires a string value.")
+            if self.df[column].dtype != pl.Utf8:
+                 return col_expr.cast(pl.Utf8).str.contains(value, literal=False)
+            return col_expr.str.contains(value, literal=False)
+        elif operator == 'in':
+            if not isinstance(value, list):
+                 return FilterError("Error: 'in' operator requires a list value.")
+            return col_expr.is_in(value)
+        return FilterError(
+            f"Error: Unsupported operator '{operator}'. Supported operators are '==', '!=', '>', '<', '>=', '<=', 'contains', 'in'."
+        )
 
 def main():
+    parser = argparse.ArgumentParser(description="eICU MCP data server (Polars)")
+    parser.add_argument("--refresh-cache", action="store_true", help="rebuild the merged table even if the cache is fresh")
+    parser.add_argument("--hash-contents", action="store_true", help="include file contents in the cache fingerprint")
+    parser.add_argument("--incremental", action="store_true", help="track rows appended to lab.csv / vitalPeriodic.csv")
+    parser.add_argument("--poll-seconds", type=float, default=0, help="with --incremental, ingest new rows every N seconds")
+    parser.add_argument("--watch-seconds", type=float, default=0, help="reload when files in the data directory change, checked every N seconds")
+    parser.add_argument("--workers", type=int, default=1, help="number of server processes sharing the memory-mapped table")
+    parser.add_argument("--export-csv", action="store_true", help="also write the merged table to complete_patient_data_polars.csv")
+    args = parser.parse_args()
+
+    if args.workers > 1 and args.incremental:
+        # Each worker would keep its own running state and tail the files separately
+        parser.error("--incremental needs a single worker")
+
     if not POLARS_AVAILABLE:
         print("Need polars: pip install polars")
         sys.exit(1)
 
-    # Load complete data (including actual outcomes)
-    complete_data = load_complete_patient_data()
-    if complete_data is None:
+    # Load complete data (including actual outcomes), reusing the cache when fresh
+    data_file = load_cached_patient_data(
+        hash_contents=args.hash_contents, refresh=args.refresh_cache
+    )
+    if data_file is None:
         sys.exit(1)
+    if args.export_csv:
+        # Save complete data as CSV for inspection
+        pl.read_ipc(data_file).write_csv("complete_patient_data_polars.csv")
+        print("Wrote complete_patient_data_polars.csv")
 
-    print("Available columns:")
-    for col in complete_data.columns:
-        print(f"  {col}")
+    if args.workers > 1:
+        import signal
 
-    # Save complete data for MCP server
-    temp_file = "complete_patient_data_polars.csv"
-    complete_data.write_csv(temp_file)
+        # This process is the only one that watches the sources and runs the
+        # ETL; workers re-map whatever cache file CACHE_POINTER names.
+        # reload_data in any worker sends SIGHUP here.
+        publish_cache_file(data_file)
+        rebuild = threading.Event()
+        signal.signal(signal.SIGHUP, lambda signum, frame: rebuild.set())
+        threading.Thread(
+            target=watch_and_publish, args=(data_file, rebuild, args.watch_seconds, args.hash_contents),
+            name="reload-watcher", daemon=True,
+        ).start()
+        print("\nMCP Server URL: http://localhost:8000/mcp")
+        serve_workers(
+            functools.partial(create_server, data_file, cache_pointer=CACHE_POINTER),
+            args.workers, host="0.0.0.0", port=8000,
+        )
+        return
+
+    ingestor = IncrementalIngestor() if args.incremental else None
+    initial_state = ingestor.initialize() if ingestor else None
 
     # Setup MCP server with complete data
-    server = PolarsMCPServerBuilder(
-        server_name="CompleteMedicalDataServerPolars",
-        csv_file_path=temp_file,
-        stateless_http=True,
+    server = create_server(
+        data_file, hash_contents=args.hash_contents, watch_seconds=args.watch_seconds, ingestor=ingestor
     )
 
     if server.df is None:
         print("Failed to create server")
         sys.exit(1)
 
+    if ingestor:
+        server.apply_patient_updates(initial_state)
+        if args.poll_seconds > 0:
+            server.start_ingest_polling(args.poll_seconds)
+            print(f"Polling for new lab/vitals rows every {args.poll_seconds}s")
+
+    print("Available columns:")
+    for col in server.df.columns:
+        print(f"  {col}")
+
     print(f"\nMCP Server ready with {server.df.height} patients")
     print("Server URL: http://localhost:8000/mcp")
-    print("Operations: filter_rows (by patient ID), get_schema, get_head")
+    print("Operations: filter_rows (by patient ID), filter_where, aggregate, get_rows_by_ids, filter_rows_batch, get_labels, get_views, get_patient_vitals, get_patient_labs, get_schema, get_head, reload_data, data_version")
+    print("Row stream: http://localhost:8000/rows.ndjson?column=age&operator=>&value=60")
     print("------")
     print("\nExample client usage:")
     print("  model_params = {")
@@ -0,0 +1,273 @@
+"""
+Partitioned Parquet layout for the raw eICU event tables
+Rewrites lab.csv / vitalPeriodic.csv into Parquet files hash-partitioned by
+patientunitstayid, and reads them back for the MCP servers.
+
+    python partition_eicu_data.py [--partitions 16] [--tables labs vitals]
+
+Layout (``eicu_partitioned/`` by default):
+
+    manifest.json                        per table: current directory, partition
+                                         count and size/mtime of the source CSV
+    <table>.<version>/part-00007.parquet every row of patient p lives in part p % N
+
+Within a part, rows are stable-sorted by patient: each patient's rows are
+contiguous and keep their CSV order, and every row group carries min/max
+statistics. A single-patient read opens one file and skips the row groups
+whose id range excludes the patient.
+
+A rewrite goes to a new ``<table>.<version>`` directory and is switched in
+by replacing manifest.json, so readers always see a complete layout. The
+previous version is kept until the next rewrite for readers still on it.
+"""
+import os
+import sys
+import json
+import time
+import fcntl
+import shutil
+import argparse
+import contextlib
+import polars as pl
+from pathlib import Path
+from typing import List, Optional
+
+DATA_DIR = Path("eicu_demo_data")
+PARTITION_DIR = Path("eicu_partitioned")
+
+# Per-patient event tables worth partitioning; the patient and APACHE
+# tables are one row per stay and stay as CSV.
+PARTITIONED_TABLES = {
+    "labs": "lab.csv",
+    "vitals": "vitalPeriodic.csv",
+}
+
+KEY_COLUMN = "patientunitstayid"
+DEFAULT_PARTITIONS = 16
+ROW_GROUP_SIZE = 16 * 1024
+BATCH_ROWS = 1_000_000
+MANIFEST_FORMAT = 2
+
+
+def partition_of(patient_id: int, num_partitions: int) -> int:
+    """Partition holding a patient's rows (ids are integers, so modulo is a stable hash)"""
+    return int(patient_id) % num_partitions
+
+
+def part_name(part: int) -> str:
+    return f"part-{part:05d}.parquet"
+
+
+def scan_event_csv(path: Path) -> pl.LazyFrame:
+    """scan_csv of a lab / vitals CSV with dtypes inferred from every row
+
+    The default looks at the first 100 rows only, so a later value of a wider
+    type (150.7 in a column of integer heart rates) fails the scan when it is
+    collected. Whole-file inference picks Float64 there, and String for a
+    column with non-numeric text, which the readers cast with strict=False.
+    """
+    return pl.scan_csv(path, infer_schema_length=None)
+
+
+def partition_table(
+    csv_path: Path,
+    out_dir: Path,
+    num_partitions: int = DEFAULT_PARTITIONS,
+    row_group_size: int = ROW_GROUP_SIZE,
+    batch_rows: int = BATCH_ROWS,
+) -> int:
+    """Write one CSV as ``out_dir/part-*.parquet``; returns the number of rows written
+
+    The CSV is read in batches of ``batch_rows``, and each batch's rows are
+    spilled to one file per partition. Each partition is then stable-sorted
+    by patient as a whole (batch order is file order), so a patient whose
+    rows straddle a batch boundary still ends up contiguous. Peak memory is
+    one batch, then one partition, not the table.
+    """
+    lf = scan_event_csv(csv_path)
+    if KEY_COLUMN not in lf.collect_schema():
+        raise ValueError(f"{csv_path} has no '{KEY_COLUMN}' column")
+
+    # Fails if out_dir exists: published directories are never written into
+    out_dir.mkdir(parents=True)
+    spill_dir = out_dir / "_spill"
+    spill_dir.mkdir()
+    spills = {}
+    rows = 0
+    for batch_no, batch in enumerate(lf.collect_batches(chunk_size=batch_rows)):
+        parts = batch.with_columns(
+            (pl.col(KEY_COLUMN) % num_partitions).alias("_part")
+        ).partition_by("_part", as_dict=True, include_key=False, maintain_order=True)
+        for (part,), frame in parts.items():
+            path = spill_dir / f"{part:05d}-{batch_no:05d}.parquet"
+            frame.sort(KEY_COLUMN, maintain_order=True).write_parquet(
+                path, row_group_size=row_group_size, statistics=True
+            )
+            spills.setdefault(part, []).append(path)
+            rows += frame.height
+
+    for part in range(num_partitions):
+        target = out_dir / part_name(part)
+        files = spills.get(part, [])
+        if len(files) == 1:
+            # A single batch is already sorted
+            os.replace(files[0], target)
+        elif files:
+            pl.scan_parquet(files).sort(KEY_COLUMN, maintain_order=True).collect().write_parquet(
+                target, row_group_size=row_group_size, statistics=True
+            )
+        else:
+            # Empty parts still get a file so readers can rely on the layout
+            lf.head(0).collect().write_parquet(target)
+    shutil.rmtree(spill_dir)
+    return rows
+
+
+@contextlib.contextmanager
+def _write_lock(out_dir: Path):
+    """Exclusive lock on out_dir so concurrent writers (e.g. server workers) take turns"""
+    with open(out_dir / ".lock", "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def partition_dataset(
+    data_dir: Path = DATA_DIR,
+    out_dir: Path = PARTITION_DIR,
+    num_partitions: int = DEFAULT_PARTITIONS,
+    tables: Optional[List[str]] = None,
+    skip_fresh: bool = False,
+) -> Path:
+    """Partition the selected event tables into new versioned directories and switch the manifest
+
+    Readers keep using the directories named in the old manifest until the
+    new one replaces it. The version before the one being replaced is
+    deleted afterwards; the one being replaced stays for in-flight readers.
+    With skip_fresh, tables that are already up to date (for instance
+    written by another process while this one waited for the lock) are left
+    alone.
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    with _write_lock(out_dir):
+        existing = PartitionedDataset.load(out_dir)
+        previous = dict(existing.manifest["tables"]) if existing is not None else {}
+        manifest = {"format": MANIFEST_FORMAT, "key": KEY_COLUMN, "tables": dict(previous)}
+
+        # Runs are serialized by the lock, so a nanosecond timestamp is unique
+        version = str(time.time_ns())
+        for name in tables or list(PARTITIONED_TABLES):
+            if skip_fresh and existing is not None and existing.is_fresh(name, data_dir):
+                continue
+            source = data_dir / PARTITIONED_TABLES[name]
+            stat = source.stat()
+            table_dir = f"{name}.{version}"
+            start = time.perf_counter()
+            rows = partition_table(source, out_dir / table_dir, num_partitions)
+            print(f"{source} -> {out_dir / table_dir}: {rows} rows in {time.perf_counter() - start:.2f}s")
+            manifest["tables"][name] = {
+                "dir": table_dir,
+                "num_partitions": num_partitions,
+                "source": source.name,
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "rows": rows,
+            }
+
+        tmp_file = out_dir / f"manifest.json.{os.getpid()}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_file, out_dir / "manifest.json")
+
+        # Keep the current and the just-replaced directory of each table
+        keep = {entry["dir"] for entry in manifest["tables"].values()}
+        keep.update(entry["dir"] for entry in previous.values())
+        for path in out_dir.iterdir():
+            if path.is_dir() and path.name not in keep:
+                shutil.rmtree(path, ignore_errors=True)
+    return out_dir
+
+
+class PartitionedDataset:
+    """Reader for a layout written by ``partition_dataset``
+
+    Holds one manifest; table directories are versioned, so the files it
+    points at are never rewritten in place.
+    """
+
+    def __init__(self, root: Path, manifest: dict):
+        self.root = Path(root)
+        self.manifest = manifest
+
+    @classmethod
+    def load(cls, root: Path = PARTITION_DIR) -> Optional["PartitionedDataset"]:
+        """Open the layout at ``root``, or None if it has not been written"""
+        try:
+            with open(Path(root) / "manifest.json") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get("format") != MANIFEST_FORMAT:
+            return None
+        return cls(root, manifest)
+
+    def is_fresh(self, table: str, data_dir: Path = DATA_DIR) -> bool:
+        """True if ``table`` was partitioned from the current version of its CSV"""
+        entry = self.manifest["tables"].get(table)
+        if entry is None:
+            return False
+        try:
+            stat = (Path(data_dir) / entry["source"]).stat()
+        except OSError:
+            return False
+        return stat.st_size == entry["size"] and stat.st_mtime_ns == entry["mtime_ns"]
+
+    def num_partitions(self, table: str) -> int:
+        return self.manifest["tables"][table]["num_partitions"]
+
+    def table_dir(self, table: str) -> Path:
+        return self.root / self.manifest["tables"][table]["dir"]
+
+    def files(self, table: str) -> List[Path]:
+        return [self.table_dir(table) / part_name(part) for part in range(self.num_partitions(table))]
+
+    def scan(self, table: str) -> pl.LazyFrame:
+        """Lazy scan over every partition of ``table``"""
+        return pl.scan_parquet(self.files(table))
+
+    def scan_patient(self, table: str, patient_id: int) -> pl.LazyFrame:
+        """Lazy scan of one patient's rows; reads only the partition that holds them
+
+        The id filter is pushed into the Parquet reader, which skips row
+        groups whose min/max statistics exclude the patient.
+        """
+        path = self.table_dir(table) / part_name(partition_of(patient_id, self.num_partitions(table)))
+        return pl.scan_parquet(path).filter(pl.col(KEY_COLUMN) == patient_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Partition the eICU event tables into Parquet by patient id")
+    parser.add_argument("--data-dir", type=Path, default=DATA_DIR, help="directory with the raw CSVs")
+    parser.add_argument("--out-dir", type=Path, default=PARTITION_DIR, help="where to write the partitioned layout")
+    parser.add_argument("--partitions", type=int, default=DEFAULT_PARTITIONS, help="number of hash partitions per table")
+    parser.add_argument(
+        "--tables", nargs="+", choices=list(PARTITIONED_TABLES), default=list(PARTITIONED_TABLES),
+        help="tables to partition",
+    )
+    args = parser.parse_args()
+    if args.partitions < 1:
+        parser.error("--partitions must be at least 1")
+
+    missing = [PARTITIONED_TABLES[name] for name in args.tables if not (args.data_dir / PARTITIONED_TABLES[name]).exists()]
+    if missing:
+        print(f"Missing files: {missing}")
+        sys.exit(1)
+
+    partition_dataset(args.data_dir, args.out_dir, args.partitions, args.tables)
+    print(f"Partitioned dataset written to {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -28,6 +28,7 @@ import os
 import asyncio
 from dotenv import load_dotenv
 from intelli.flow import Agent, Task, Flow, TextTaskInput, AgentTypes
+from llm_response_cache import CachedAgent, response_cache_from_env
 import json
 
 # Load environment variables
@@ -56,24 +57,34 @@ Preferences: Loves Asian and Mediterranean food, dislikes fish, needs quick meal
 Budget: Moderate, prefers affordable ingredients
 """
 
+"""## Response Cache (optional)
+Set `LLM_RESPONSE_CACHE=1` to answer reruns with the same case notes from disk
+instead of calling the APIs again (`llm_response_cache.py` sits next to this lab).
+Caching is off by default so every run gets fresh answers.
+"""
+
+response_cache = response_cache_from_env("./output/llm_cache")
+
 """## Create Agents
 Set up two specialized agents - one for assessment and one for planning.
 """
 
 # Agent 1: Nutrition Assessor (OpenAI)
-nutrition_assessor = Agent(
+nutrition_assessor = CachedAgent(
     agent_type=AgentTypes.TEXT.value,
     provider="openai",
     mission="Extract nutrition-relevant information from client notes",
-    model_params={"key": OPENAI_KEY, "model": "gpt-4.1"}
+    model_params={"key": OPENAI_KEY, "model": "gpt-4.1"},
+    cache=response_cache
 )
 
 # Agent 2: Meal Planner (Anthropic)
-meal_planner = Agent(
+meal_planner = CachedAgent(
     agent_type=AgentTypes.TEXT.value,
     provider="anthropic",
     mission="Create personalized meal plans",
-    model_params={"key": ANTHROPIC_KEY, "model": "claude-sonnet-4-20250514"}
+    model_params={"key": ANTHROPIC_KEY, "model": "claude-sonnet-4-20250514"},
+    cache=response_cache
 )
 
 """## Create Tasks
@@ -145,3 +156,6 @@ print(results["assessment_task"]["output"])
 print("\n\n=== MEAL PLAN (Anthropic) ===")
 print(results["planning_task"]["output"])
 
+if response_cache is not None:
+    print(f"\nResponse cache: {response_cache.stats()}")
+
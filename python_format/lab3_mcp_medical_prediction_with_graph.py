@@ -36,10 +36,13 @@ In this tutorial, you will learn how to:
 import os
 import asyncio
 import json
-import pandas as pd
+import random
 import re
+import threading
 from dotenv import load_dotenv
 from intelli.flow import Agent, Task, Flow, TextTaskInput, AgentTypes
+from llm_response_cache import CachedAgent, response_cache_from_env
+from intelli.wrappers.mcp_wrapper import MCPWrapper
 
 load_dotenv()
 
@@ -58,33 +61,117 @@ print(f"OpenAI key: {'✓' if OPENAI_KEY else '✗'}")
 Common functions and preprocessors used throughout the code.
 """
 
+OUTCOME_COLUMNS = ['actualicumortality', 'actualiculos', 'expired']
+
+# Prefix the server puts on results requested with arg_format="arrow"
+ARROW_IPC_PREFIX = "arrow-ipc;base64,"
+
+def rows_to_table(text_input):
+    """Decode a base64 Arrow IPC result (arg_format="arrow") into a pyarrow.Table"""
+    import base64
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    payload = base64.b64decode(text_input.strip()[len(ARROW_IPC_PREFIX):])
+    table = pa.ipc.open_stream(payload).read_all()
+    # The server stores vitals as float32; go through the string form so
+    # 72.29 stays 72.29 instead of 72.29000091552734
+    for i, field in enumerate(table.schema):
+        if field.type == pa.float32():
+            column = pc.cast(pc.cast(table.column(i), pa.string()), pa.float64())
+            table = table.set_column(i, field.name, column)
+    return table
+
+def rows_to_records(text_input):
+    """Parse an MCP rows result (JSON or base64 Arrow IPC stream) into a list of dicts"""
+    text_input = text_input.strip()
+    if text_input.startswith(ARROW_IPC_PREFIX):
+        return rows_to_table(text_input).to_pylist()
+
+    data = json.loads(text_input)
+    return data if isinstance(data, list) else [data]
+
+# What the prompt gets when there is nothing to tabulate
+NO_ROWS_TEXT = "(no rows)\n"
+
+def _format_cell(value):
+    return "" if value is None else str(value)
+
+def _rows_to_text(columns, rows, output_format="csv"):
+    """Serialise rows (sequences in column order) as compact CSV or a markdown table"""
+    if not columns:
+        return NO_ROWS_TEXT
+    if output_format == "markdown":
+        lines = ["| " + " | ".join(columns) + " |", "|" + "---|" * len(columns)]
+        for row in rows:
+            cells = (_format_cell(value).replace("|", "\\|") for value in row)
+            lines.append("| " + " | ".join(cells) + " |")
+        return "\n".join(lines) + "\n"
+
+    import csv
+    import io
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([_format_cell(value) for value in row])
+    return buffer.getvalue()
+
+def records_to_text(records, columns, output_format="csv"):
+    """Serialise records as compact CSV or a markdown table for the prompt
+
+    With no records the header is still written; with no columns there is
+    nothing to tabulate and NO_ROWS_TEXT is returned instead:
+
+    >>> records_to_text([], ["age"], "markdown")
+    '| age |\\n|---|\\n'
+    >>> records_to_text([], [], "markdown")
+    '(no rows)\\n'
+    """
+    return _rows_to_text(columns, ([record.get(col) for col in columns] for record in records), output_format)
+
+def table_to_text(table, output_format="csv"):
+    """Serialise a pyarrow.Table column by column, without building per-row dicts"""
+    columns = [table.column(name).to_pylist() for name in table.column_names]
+    return _rows_to_text(table.column_names, zip(*columns), output_format)
+
 class MedicalDataProcessor:
     """Preprocessor to clean medical data and remove outcome leakage"""
 
     @staticmethod
-    def remove_outcome_data(text_input):
-        """Remove actual outcome columns from patient data using pandas"""
+    def strip_outcomes(records):
+        """Drop outcome keys from each record; returns (kept columns, removed columns)"""
+        columns = []
+        for record in records:
+            for col in record:
+                if col not in columns:
+                    columns.append(col)
+        removed = [col for col in columns if col in OUTCOME_COLUMNS]
+        for record in records:
+            for col in removed:
+                record.pop(col, None)
+        return [col for col in columns if col not in removed], removed
+
+    @staticmethod
+    def strip_outcomes_table(table):
+        """Drop outcome columns from a pyarrow.Table (no data is copied); returns (table, removed)"""
+        removed = [col for col in table.column_names if col in OUTCOME_COLUMNS]
+        return table.drop_columns(removed), removed
+
+    @staticmethod
+    def remove_outcome_data(text_input, output_format="csv"):
+        """Remove actual outcome columns from patient data (csv or markdown output)"""
         if not text_input or not isinstance(text_input, str):
             return text_input
 
         try:
-            import json
-            data = json.loads(text_input.strip())
+            records = rows_to_records(text_input)
+            columns, removed = MedicalDataProcessor.strip_outcomes(records)
 
-            if isinstance(data, list):
-                df = pd.DataFrame(data)
-            else:
-                df = pd.DataFrame([data])
+            if removed:
+                print(f"Preprocessor: Removed {len(removed)} outcome columns: {removed}")
 
-            outcome_columns = ['actualicumortality', 'actualiculos', 'expired']
-            columns_to_drop = [col for col in outcome_columns if col in df.columns]
-
-            if columns_to_drop:
-                df = df.drop(columns=columns_to_drop)
-                print(f"Preprocessor: Removed {len(columns_to_drop)} outcome columns: {columns_to_drop}")
-
-            cleaned_text = df.to_csv(index=False)
-            print(f"Preprocessor: Data shape after cleaning: {df.shape}")
+            cleaned_text = records_to_text(records, columns, output_format)
+            print(f"Preprocessor: Data shape after cleaning: {(len(records), len(columns))}")
 
             return cleaned_text
 
@@ -92,6 +179,32 @@ class MedicalDataProcessor:
             print(f"Preprocessor error: {e}, falling back to original data")
             return text_input
 
+    @staticmethod
+    def remove_outcome_data_batch(payloads, output_format="csv"):
+        """Clean many patients at once: {patient_id: rows} -> {patient_id: prompt text}
+
+        Accepts the dict returned by fetch_patients_batch: rows text, or
+        pyarrow.Tables for format="arrow", which stay columnar until the prompt
+        text is written. Patients whose payload cannot be parsed keep their
+        original text, as in remove_outcome_data.
+        """
+        cleaned = {}
+        for patient_id, text_input in payloads.items():
+            if not isinstance(text_input, str):
+                table, _ = MedicalDataProcessor.strip_outcomes_table(text_input)
+                cleaned[patient_id] = table_to_text(table, output_format)
+                continue
+            try:
+                records = rows_to_records(text_input)
+            except Exception as e:
+                print(f"Preprocessor error for patient {patient_id}: {e}, falling back to original data")
+                cleaned[patient_id] = text_input
+                continue
+            columns, _ = MedicalDataProcessor.strip_outcomes(records)
+            cleaned[patient_id] = records_to_text(records, columns, output_format)
+        print(f"Preprocessor: Cleaned {len(cleaned)} patients")
+        return cleaned
+
 def extract_prediction_json(text_output):
     """Extract prediction JSON from model output"""
     try:
@@ -105,48 +218,216 @@ def extract_prediction_json(text_output):
     except:
         return None
 
-def extract_actual_outcome(raw_data, patient_id):
-    """Extract actual outcome from raw MCP data using pandas"""
-    try:
-        if not raw_data or raw_data.strip() in ['[]', '[\n\n]', '']:
-            print(f"MCP returned empty data for patient {patient_id}")
-            return "UNKNOWN"
+def outcome_from_record(record):
+    """EXPIRED / SURVIVED from a row's outcome columns, UNKNOWN if it has none"""
+    if 'actualicumortality' in record:
+        mortality_value = record['actualicumortality']
+        return "EXPIRED" if mortality_value is not None and "EXPIRED" in str(mortality_value).upper() else "SURVIVED"
+    elif 'expired' in record:
+        return "EXPIRED" if record['expired'] else "SURVIVED"
+    return "UNKNOWN"
+
+"""Opt-in response cache: set `LLM_RESPONSE_CACHE=1` to answer identical prompts
+(same provider, model params, mission and pre-processed patient data) from disk
+instead of the API. Off by default, so evaluation reruns always call the model.
+"""
 
-        data = json.loads(raw_data.strip())
+response_cache = response_cache_from_env(os.path.join(OUTPUT_DIR, "llm_cache"))
 
-        if isinstance(data, list):
-            df = pd.DataFrame(data)
-        else:
-            df = pd.DataFrame([data])
+"""Shared MCP connection: one keep-alive session per server, reused by every flow,
+task and concurrent patient. The handshake and tool discovery run once per process.
+"""
 
-        if df.empty:
-            print(f"No data found for patient {patient_id}")
-            return "UNKNOWN"
+# Tools that only read server state; a failed call to any other tool
+# (reload_data, ingest_new_rows, ...) is never sent a second time
+READ_ONLY_TOOLS = {
+    "get_head", "get_schema", "get_shape", "select_columns", "filter_rows", "filter_where",
+    "aggregate", "get_rows_by_ids", "filter_rows_batch", "get_labels", "get_views",
+    "data_version", "get_patient_vitals", "get_patient_labs",
+}
 
-        patient_row = df[df['patientunitstayid'] == patient_id]
+class MCPSessionPool:
+    """Keep-alive MCP client sessions, one per server configuration, on a background event loop"""
 
-        if patient_row.empty:
-            return "UNKNOWN"
+    def __init__(self, retry_tools=READ_ONLY_TOOLS):
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, daemon=True).start()
+        self.retry_tools = set(retry_tools)
+        self._sessions = {}  # server key -> (connected MCPWrapper, closed event)
+        self.tools = {}      # server key -> tool names discovered at connect time
+        self._connect_lock = None
 
-        if 'actualicumortality' in patient_row.columns:
-            mortality_value = patient_row['actualicumortality'].iloc[0]
-            return "EXPIRED" if pd.notna(mortality_value) and "EXPIRED" in str(mortality_value).upper() else "SURVIVED"
-        elif 'expired' in patient_row.columns:
-            expired_value = patient_row['expired'].iloc[0]
-            return "EXPIRED" if expired_value else "SURVIVED"
+    @staticmethod
+    def _key(server_config):
+        return json.dumps(server_config, sort_keys=True, default=str)
 
-        return "UNKNOWN"
+    async def _run_session(self, key, server_config, ready, closed):
+        """Own one session for its whole life so its contexts exit in the same task"""
+        try:
+            # Same transports and options (headers, timeout, stdio command) as the MCP agent
+            wrapper = MCPWrapper(server_config)
+            async with wrapper.aconnect():
+                self.tools[key] = [tool.name for tool in (await wrapper.get_tools_async()).tools]
+                ready.set_result(wrapper)
+                await closed.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+
+    async def _get_session(self, server_config):
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        key = self._key(server_config)
+        async with self._connect_lock:
+            if key not in self._sessions:
+                ready, closed = self._loop.create_future(), asyncio.Event()
+                self._loop.create_task(self._run_session(key, server_config, ready, closed))
+                self._sessions[key] = (await ready, closed)
+                server = server_config.get("url") or server_config.get("command")
+                print(f"MCP pool: connected to {server}, tools: {', '.join(self.tools[key])}")
+            return self._sessions[key][0]
+
+    async def _drop(self, key):
+        entry = self._sessions.pop(key, None)
+        if entry:
+            entry[1].set()
+
+    async def _call_tool(self, server_config, tool, arguments):
+        attempts = 2 if tool in self.retry_tools else 1
+        for attempt in range(1, attempts + 1):
+            wrapper = await self._get_session(server_config)
+            try:
+                return await wrapper.execute_tool_async(tool, arguments)
+            except Exception:
+                # Stale connection (e.g. server restart): reconnect, and resend
+                # only if the tool is read-only
+                await self._drop(self._key(server_config))
+                if attempt == attempts:
+                    raise
+
+    def call_tool(self, server_config, tool, arguments):
+        """Thread-safe synchronous tool call over the pooled session for server_config"""
+        future = asyncio.run_coroutine_threadsafe(self._call_tool(server_config, tool, arguments), self._loop)
+        return future.result()
+
+    def close(self):
+        for key in list(self._sessions):
+            asyncio.run_coroutine_threadsafe(self._drop(key), self._loop).result()
+
+mcp_pool = MCPSessionPool()
+
+class PooledMCPAgent(Agent):
+    """MCP agent that calls tools through the shared MCPSessionPool
+
+    model_params are read exactly as the stock MCP agent reads them: url or
+    command/args/env, headers, transport, timeout, tool, arg_* and input_arg.
+    """
+
+    def __init__(self, *args, pool=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = pool or mcp_pool
+
+    def execute(self, agent_input, new_params={}):
+        params = dict(self.model_params or {})
+        params.update(new_params or {})
+        handler = self._get_handler()
 
-    except Exception as e:
-        print(f"Error extracting outcome: {e}")
-        return "UNKNOWN"
+        try:
+            server_config = handler._create_server_config(params)
+            tool, arguments = handler._prepare_tool_arguments(agent_input, params)
+            result = MCPWrapper.normalize_tool_result(self.pool.call_tool(server_config, tool, arguments))
+        except Exception as e:
+            return f"Error executing MCP agent: {e}"
+
+        if result["is_error"]:
+            return f"Error from MCP tool '{tool}': {result['text']}"
+        if result["text"]:
+            return result["text"]
+        if result["structured"] is not None:
+            return result["structured"]
+        return ""
+
+"""Load many patients with one MCP call instead of one flow per patient."""
+
+def split_table_by_patient(table, patient_ids):
+    """{patient_id: pyarrow.Table} from one sort and zero-copy slices
+
+    Patients without rows get an empty table with the same schema.
+    """
+    import numpy as np
+    table = table.sort_by("patientunitstayid")
+    keys = table.column("patientunitstayid").to_numpy()
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else []
+    ends = list(starts[1:]) + [len(keys)]
+    by_patient = {int(keys[start]): table.slice(start, end - start) for start, end in zip(starts, ends)}
+    return {int(pid): by_patient.get(int(pid), table.slice(0, 0)) for pid in patient_ids}
+
+async def fetch_patients_batch(patient_ids, columns=None, exclude_columns=None, format="json"):
+    """Fetch rows for all patient_ids in a single get_rows_by_ids request
+
+    columns / exclude_columns are applied on the server before serialisation,
+    e.g. exclude_columns=OUTCOME_COLUMNS to never transfer the labels.
+    format="arrow" transfers the cohort as one Arrow IPC stream (smaller than
+    JSON from about ten rows on) and returns {patient_id: pyarrow.Table};
+    the default returns {patient_id: JSON rows text}.
+    """
+    batch_agent = PooledMCPAgent(
+        agent_type=AgentTypes.MCP.value,
+        provider="mcp",
+        mission="Load clinical data for a cohort of patients",
+        model_params={
+            "url": MCP_URL,
+            "tool": "get_rows_by_ids",
+            "arg_ids": list(patient_ids),
+            "arg_columns": columns,
+            "arg_exclude_columns": exclude_columns,
+            "arg_format": format,
+        }
+    )
+    batch_task = Task(TextTaskInput("Load cohort clinical data"), batch_agent, log=False)
+    batch_flow = Flow(tasks={"batch": batch_task}, map_paths={"batch": []}, log=False)
+
+    result = await batch_flow.start()
+    output = result["batch"]["output"].strip()
+    if format == "arrow":
+        return split_table_by_patient(rows_to_table(output), patient_ids)
+
+    grouped = json.loads(output)
+
+    # Same per-patient JSON payload that filter_rows returns
+    return {int(pid): json.dumps(rows) for pid, rows in grouped.items()}
+
+"""Fetch ground-truth outcomes separately from the "labels" view, so prediction
+requests (view="features") never carry label columns.
+"""
+
+async def fetch_labels(patient_ids=None):
+    """Map patient id -> EXPIRED / SURVIVED with one get_labels request"""
+    labels_agent = PooledMCPAgent(
+        agent_type=AgentTypes.MCP.value,
+        provider="mcp",
+        mission="Load patient outcomes for evaluation",
+        model_params={
+            "url": MCP_URL,
+            "tool": "get_labels",
+            "arg_ids": list(patient_ids) if patient_ids is not None else None,
+        }
+    )
+    labels_task = Task(TextTaskInput("Load patient outcomes"), labels_agent, log=False)
+    labels_flow = Flow(tasks={"labels": labels_task}, map_paths={"labels": []}, log=False)
+
+    result = await labels_flow.start()
+    return {
+        record["patientunitstayid"]: outcome_from_record(record)
+        for record in rows_to_records(result["labels"]["output"])
+    }
 
 """## Test MCP Server Connection
 Verify that the MCP server is running and accessible.
 """
 
 # Create the MCP client agent
-test_agent = Agent(
+test_agent = PooledMCPAgent(
     agent_type=AgentTypes.MCP.value,
     provider="mcp",
     mission="Test server connection",
@@ -187,7 +468,7 @@ PATIENT_IDS = [2834225, 1730330, 1591672, 1555349]
 TEST_PATIENT_ID = PATIENT_IDS[2]
 
 # Set up MCP data loading agent
-data_agent = Agent(
+data_agent = PooledMCPAgent(
     agent_type=AgentTypes.MCP.value,
     provider="mcp",
     mission="Load comprehensive patient clinical data",
@@ -196,12 +477,16 @@ data_agent = Agent(
         "tool": "filter_rows",
         "arg_column": "patientunitstayid",
         "arg_operator": "==",
-        "arg_value": TEST_PATIENT_ID
+        "arg_value": TEST_PATIENT_ID,
+        # Outcome columns stay on the server; labels come from fetch_labels
+        "arg_view": "features"
+        # One row is much smaller as JSON than as base64 Arrow; use
+        # fetch_patients_batch(..., format="arrow") for cohorts
     }
 )
 
-# prediction agent
-prediction_agent = Agent(
+# prediction agent (cached only when LLM_RESPONSE_CACHE is set)
+prediction_agent = CachedAgent(
     agent_type=AgentTypes.TEXT.value,
     provider="openai",
     mission="Predict patient mortality from clinical data",
@@ -209,9 +494,22 @@ prediction_agent = Agent(
         "key": OPENAI_KEY,
         "model": "gpt-4o",
         "max_tokens": 1000
-    }
+    },
+    cache=response_cache
 )
 
+def clone_agent(template, **param_updates):
+    """Independent copy of an agent template with updated model_params"""
+    extra = {"cache": template.cache} if isinstance(template, CachedAgent) else {}
+    return type(template)(
+        agent_type=template.type,
+        provider=template.provider,
+        mission=template.mission,
+        model_params={**template.model_params, **param_updates},
+        options=template.options,
+        **extra,
+    )
+
 """### Create Tasks
 
 Define tasks with preprocessor to remove outcome data from prediction input.
@@ -281,20 +579,31 @@ async def run_prediction_flow():
 
     print(f"\nRunning prediction for patient {TEST_PATIENT_ID}...")
 
-    # Update data agent with current test patient ID
-    data_agent.model_params["arg_value"] = TEST_PATIENT_ID
+    # Same graph as `flow`, on a copy of the data agent so the template stays untouched
+    patient_flow = Flow(
+        tasks={
+            "load_patient_data": Task(
+                TextTaskInput("Load patient clinical data"),
+                clone_agent(data_agent, arg_value=TEST_PATIENT_ID),
+                log=True
+            ),
+            "predict_mortality": prediction_task
+        },
+        map_paths={"load_patient_data": ["predict_mortality"]},
+        log=True
+    )
 
     try:
         # Run flow
-        results = await flow.start()
+        results = await patient_flow.start()
 
-        raw_data = results["load_patient_data"]["output"]
         prediction_output = results["predict_mortality"]["output"]
 
         print(f"Raw prediction output: {prediction_output[:150]}...")
 
         prediction_json = extract_prediction_json(prediction_output)
-        actual_outcome = extract_actual_outcome(raw_data, TEST_PATIENT_ID)
+        labels = await fetch_labels([TEST_PATIENT_ID])
+        actual_outcome = labels.get(TEST_PATIENT_ID, "UNKNOWN")
 
         return prediction_json, actual_outcome
 
@@ -319,6 +628,132 @@ print(f"Correct: {'✓' if predicted == actual_result else '✗'}")
 print(f"Key factors: {', '.join(key_factors)}")
 print("="*50)
 
+"""## Cohort Prediction
+
+Score many patients concurrently. The cohort's features are fetched with one
+`get_rows_by_ids` call up front, and each patient's prediction flow starts from its
+slice of that result, so N patients cost one MCP round-trip instead of N. Every
+flow gets its own copy of the `prediction_agent` template, so runs never share
+mutable state.
+"""
+
+def build_patient_flow():
+    """Fresh prediction flow for one patient; start it with the patient's prefetched data"""
+    patient_prediction_task = Task(
+        TextTaskInput(prediction_prompt),
+        clone_agent(prediction_agent),
+        log=False
+    )
+    return Flow(
+        tasks={"predict_mortality": patient_prediction_task},
+        map_paths={"predict_mortality": []},
+        log=False
+    )
+
+class ProviderRateLimiter:
+    """Spaces out flow starts per provider to stay under requests-per-minute limits"""
+
+    def __init__(self, requests_per_minute):
+        self.intervals = {provider: 60.0 / rpm for provider, rpm in requests_per_minute.items()}
+        self._next_slot = {}
+        self._lock = asyncio.Lock()
+
+    async def wait(self, provider):
+        if provider not in self.intervals:
+            return
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            now = loop.time()
+            slot = max(now, self._next_slot.get(provider, now))
+            self._next_slot[provider] = slot + self.intervals[provider]
+        await asyncio.sleep(slot - now)
+
+async def predict_patient(patient_id, patient_data, semaphore, rate_limiter, labels,
+                          max_retries=3, base_delay=1.0):
+    """Run one patient's flow on its prefetched data with retry and exponential backoff"""
+    if patient_data is None:
+        print(f"✗ Patient {patient_id}: no rows returned by the server")
+        return {"patient_id": patient_id, "predicted": "UNKNOWN", "actual": labels.get(patient_id, "UNKNOWN"),
+                "key_factors": [], "attempts": 0}
+
+    async with semaphore:
+        for attempt in range(1, max_retries + 1):
+            try:
+                await rate_limiter.wait(prediction_agent.provider)
+                results = await build_patient_flow().start(initial_input=patient_data)
+
+                prediction_json = extract_prediction_json(results["predict_mortality"]["output"])
+                if prediction_json is None:
+                    raise ValueError("no prediction JSON in model output")
+                actual_outcome = labels.get(patient_id, "UNKNOWN")
+
+                return {
+                    "patient_id": patient_id,
+                    "predicted": prediction_json.get("prediction", "UNKNOWN"),
+                    "actual": actual_outcome,
+                    "key_factors": prediction_json.get("key_factors", []),
+                    "attempts": attempt,
+                }
+            except Exception as e:
+                if attempt == max_retries:
+                    print(f"✗ Patient {patient_id} failed after {attempt} attempts: {e}")
+                    break
+                delay = base_delay * 2 ** (attempt - 1) * (1 + random.random())
+                print(f"Patient {patient_id} attempt {attempt} failed ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    return {"patient_id": patient_id, "predicted": "UNKNOWN", "actual": "UNKNOWN",
+            "key_factors": [], "attempts": max_retries}
+
+async def run_cohort_predictions(patient_ids, concurrency=4, requests_per_minute=None,
+                                 max_retries=3, base_delay=1.0):
+    """Predict all patients concurrently and return a per-patient results table"""
+    semaphore = asyncio.Semaphore(concurrency)
+    rate_limiter = ProviderRateLimiter(requests_per_minute or {})
+
+    # All outcomes in one small request instead of one per patient payload
+    labels = await fetch_labels(patient_ids)
+
+    # All features in one Arrow request; outcome columns never leave the server
+    tables = await fetch_patients_batch(patient_ids, exclude_columns=OUTCOME_COLUMNS, format="arrow")
+    patient_data = MedicalDataProcessor.remove_outcome_data_batch(
+        {pid: table for pid, table in tables.items() if table.num_rows}
+    )
+
+    rows = await asyncio.gather(*[
+        predict_patient(pid, patient_data.get(pid), semaphore, rate_limiter, labels, max_retries, base_delay)
+        for pid in patient_ids
+    ])
+
+    # pandas only for the cohort table; per-patient prediction stays pandas-free
+    import pandas as pd
+
+    results_df = pd.DataFrame(rows)
+    results_df["correct"] = (
+        (results_df["predicted"] == results_df["actual"]) & (results_df["actual"] != "UNKNOWN")
+    )
+    return results_df
+
+def summarize_cohort(results_df):
+    """Accuracy over scored patients plus an actual-vs-predicted table"""
+    import pandas as pd
+
+    scored = results_df[(results_df["predicted"] != "UNKNOWN") & (results_df["actual"] != "UNKNOWN")]
+    accuracy = scored["correct"].mean() if len(scored) else float("nan")
+    print(f"Scored {len(scored)}/{len(results_df)} patients, accuracy: {accuracy:.2%}")
+    return pd.crosstab(results_df["actual"], results_df["predicted"], margins=True)
+
+cohort_results = await run_cohort_predictions(
+    PATIENT_IDS,
+    concurrency=4,
+    requests_per_minute={"openai": 60}
+)
+summarize_cohort(cohort_results)
+
+if response_cache is not None:
+    print(f"Response cache: {response_cache.stats()}")
+print(f"MCP sessions opened: {len(mcp_pool.tools)}")
+
 """# Appendix
 
 ## Get all patients
@@ -327,15 +762,17 @@ print("="*50)
 async def get_all_patient_ids_via_flow():
     """Get all patient IDs using MCP flow only"""
     try:
-        # Create agent to get all data from server
-        get_all_agent = Agent(
+        # Create agent that asks the server for the distinct ids only
+        get_all_agent = PooledMCPAgent(
             agent_type=AgentTypes.MCP.value,
             provider="mcp",
-            mission="Get all patient data",
+            mission="Get all patient ids",
             model_params={
                 "url": MCP_URL,
-                "tool": "get_head",
-                "arg_n": 50  # Get enough rows to capture all patients
+                "tool": "aggregate",
+                "arg_metrics": [
+                    {"column": "patientunitstayid", "op": "distinct", "alias": "patient_ids"}
+                ]
             }
         )
 
@@ -351,13 +788,9 @@ async def get_all_patient_ids_via_flow():
         result = await get_all_flow.start()
         raw_data = result["get_all"]["output"]
 
-        # Parse JSON response and extract patient IDs
-
+        # Parse JSON response: one row holding the distinct patient IDs
         data = json.loads(raw_data.strip())
-        df = pd.DataFrame(data)
-
-        # Get unique patient IDs
-        patient_ids = df['patientunitstayid'].unique().tolist()
+        patient_ids = data[0]["patient_ids"]
         print(f"Found {len(patient_ids)} patients via MCP flow")
         return patient_ids
 
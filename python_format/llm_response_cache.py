@@ -0,0 +1,132 @@
+"""
+Opt-in disk cache for LLM agent responses, shared by the labs
+
+Identical prompts (same provider, model params, mission and input) are
+answered from disk instead of the API. Caching is off unless enabled:
+set LLM_RESPONSE_CACHE=1 (cache under the lab's default directory) or
+LLM_RESPONSE_CACHE=<directory>, or pass a ResponseCache explicitly.
+Keep it off for evaluation runs, where a rerun should call the models again.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from intelli.flow import Agent
+
+CACHE_ENV_VAR = "LLM_RESPONSE_CACHE"
+
+
+class ResponseCache:
+    """Disk cache for LLM responses with TTL and size-based LRU eviction"""
+
+    def __init__(self, cache_dir, ttl_seconds=7 * 24 * 3600, max_bytes=50 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(agent, agent_input, params):
+        """Hash of everything that determines the response (API key excluded)"""
+        payload = {
+            "type": agent.type,
+            "provider": agent.provider,
+            "mission": agent.mission,
+            "model_params": {k: v for k, v in params.items() if k != "key"},
+            "input": agent_input.desc,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    def get(self, key):
+        path = os.path.join(self.cache_dir, f"{key}.json")
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+            if time.time() - entry["created"] > self.ttl_seconds:
+                os.remove(path)
+                raise FileNotFoundError(path)
+            os.utime(path)  # mark as recently used
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return entry["response"]
+
+    def put(self, key, response):
+        path = os.path.join(self.cache_dir, f"{key}.json")
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"created": time.time(), "response": response}, f)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes"""
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(".json"):
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                    entries.append((stat.st_mtime, stat.st_size, name))
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    continue
+                total -= size
+                self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class CachedAgent(Agent):
+    """Agent that answers repeated identical prompts from a ResponseCache"""
+
+    def __init__(self, *args, cache=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache = cache
+
+    def execute(self, agent_input, new_params={}):
+        if self.cache is None:
+            return super().execute(agent_input, new_params)
+
+        params = dict(self.model_params or {})
+        params.update(new_params or {})
+        key = self.cache.make_key(self, agent_input, params)
+
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        response = super().execute(agent_input, new_params)
+        # Only cache successful text responses
+        if isinstance(response, str) and response and not response.startswith("Error"):
+            self.cache.put(key, response)
+        return response
+
+
+def response_cache_from_env(default_dir, env_var=CACHE_ENV_VAR):
+    """ResponseCache if the env var enables it ("1"/"true" or a directory), else None"""
+    value = os.getenv(env_var, "").strip()
+    if not value or value.lower() in ("0", "false", "no", "off"):
+        return None
+    cache_dir = default_dir if value.lower() in ("1", "true", "yes", "on") else value
+    print(f"LLM response cache enabled: {cache_dir}")
+    return ResponseCache(cache_dir)